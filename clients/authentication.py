@@ -0,0 +1,167 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+ProfileInfo = namedtuple('ProfileInfo', ['role', 'is_seller_approved', 'is_active'])
+
+
+class ProfileCache:
+    """
+    Short lived cache of (role, is_seller_approved, is_active) per user id in
+    the shared Django cache, so every worker sees the same entry. User and
+    UserProfile saves and deletes keep it fresh (see clients.models),
+    queryset .update() calls do not and are only picked up once the entry
+    expires.
+    """
+    key_prefix = 'clients:profile:'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def get(self, user_id):
+        row = cache.get(f'{self.key_prefix}{user_id}')
+        return ProfileInfo(*row) if row is not None else None
+
+    def set(self, user_id, info):
+        if self.ttl <= 0:
+            return
+        cache.set(f'{self.key_prefix}{user_id}', tuple(info), timeout=self.ttl)
+
+    def delete(self, user_id):
+        cache.delete(f'{self.key_prefix}{user_id}')
+
+
+profile_cache = ProfileCache(getattr(settings, 'PROFILE_CACHE_TTL', 60))
+
+
+def get_account(user_id):
+    """
+    The cached ProfileInfo of a user id, one query on a miss. role is None
+    for users without a profile, the result None for users that do not exist.
+    """
+    info = profile_cache.get(user_id)
+    if info is not None:
+        return info
+
+    row = User.objects.filter(pk=user_id).values_list(
+        'userprofile__role', 'userprofile__is_seller_approved', 'is_active'
+    ).first()
+    if row is None:
+        return None
+    info = ProfileInfo(*row)
+    profile_cache.set(user_id, info)
+    return info
+
+
+def get_profile_info(user):
+    """
+    Return the ProfileInfo of a User or TokenPrincipal, or None for anonymous
+    users and users without a profile. Never taken from token claims: a
+    revoked seller must lose access before their token expires.
+    """
+    if not user or not user.is_authenticated:
+        return None
+
+    if not isinstance(user, TokenPrincipal) and 'userprofile' in user._state.fields_cache:
+        profile = user.userprofile
+        return ProfileInfo(profile.role, profile.is_seller_approved, user.is_active)
+
+    info = get_account(user.pk)
+    if info is None or info.role is None:
+        return None
+    return info
+
+
+class TokenPrincipal(SimpleLazyObject):
+    """
+    request.user for JWT requests. The id comes from the token, role and
+    approval flag from the profile cache (one query on a miss), the User row
+    is only loaded when anything else is accessed.
+    """
+
+    def __init__(self, validated_token, load_user):
+        super().__init__(load_user)
+        self.__dict__['_token'] = validated_token
+
+    @property
+    def __class__(self):
+        # Lets the principal stand in for a User in filters like user=request.user
+        # without loading the row.
+        return User
+
+    _meta = User._meta
+
+    def __getattr__(self, name):
+        # ORM code probes values with hasattr(), answer those from the User
+        # class instead of loading the row just to find nothing
+        if name != '_state' and not hasattr(User, name):
+            raise AttributeError(name)
+        return super().__getattr__(name)
+
+    @property
+    def id(self):
+        # simplejwt stores the id as a string
+        return User._meta.pk.to_python(self._token[api_settings.USER_ID_CLAIM])
+
+    pk = id
+
+    def _is_pk_set(self, meta=None):
+        return True
+
+    @property
+    def role(self):
+        info = get_profile_info(self)
+        return info.role if info else None
+
+    @property
+    def is_seller_approved(self):
+        info = get_profile_info(self)
+        return bool(info and info.is_seller_approved)
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, TokenPrincipal):
+            return self.pk == other.pk
+        if isinstance(other, User):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that defers the User query until a view needs more than
+    the user id. Deleted and deactivated users are still turned away, from the
+    profile cache instead of the User row.
+    """
+
+    def get_user(self, validated_token):
+        # Fail fast on tokens without a user id, like JWTAuthentication does
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        principal = TokenPrincipal(
+            validated_token, lambda: super(ClaimsJWTAuthentication, self).get_user(validated_token)
+        )
+
+        account = get_account(principal.pk)
+        if account is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not account.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return principal
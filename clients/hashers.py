@@ -0,0 +1,27 @@
+"""
+Password hashers with their cost taken from settings, see PASSWORD_HASHER
+in core.settings. The algorithm names are Django's own, so hashes stay
+readable by the stock hashers. When the cost settings change, Django
+rehashes a password the next time its user logs in (must_update).
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    # Upper bound only, OpenSSL refuses anything above 32 MiB by default
+    maxmem = 1024 * 1024 * 1024
+
+    def __init__(self):
+        self.work_factor = settings.SCRYPT_WORK_FACTOR
+        self.block_size = settings.SCRYPT_BLOCK_SIZE
+        self.parallelism = settings.SCRYPT_PARALLELISM
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id, needs the argon2-cffi package"""
+
+    def __init__(self):
+        self.time_cost = settings.ARGON2_TIME_COST
+        self.memory_cost = settings.ARGON2_MEMORY_COST
+        self.parallelism = settings.ARGON2_PARALLELISM
@@ -0,0 +1,74 @@
+import importlib.util
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from clients.services import provision_user
+from core.benchmarking import percentile, throwaway_database
+
+HASHERS = {
+    # name: hasher, the Django default first as the reference
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'clients.hashers.TunedScryptPasswordHasher',
+    'argon2': 'clients.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD = 'benchmark-password-1'
+
+
+class Command(BaseCommand):
+    help = (
+        "Log in through POST /api/auth/ with passwords hashed by each hasher and report "
+        "logins per CPU second (one core) and latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--hashers', nargs='+', choices=HASHERS, default=list(HASHERS))
+
+    def handle(self, *args, **options):
+        names = [name for name in options['hashers'] if self.available(name)]
+        with throwaway_database(), override_settings(LOGIN_THROTTLE_IP=(10 ** 9, 10 ** 9)):
+            results = {name: self.run(name, options['repeat']) for name in names}
+
+        self.stdout.write(f"{'hasher':<10}{'logins/cpu s':>14}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<10}{result['per_cpu_second']:>14.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+            )
+        if 'pbkdf2' in results:
+            for name, result in results.items():
+                if name != 'pbkdf2':
+                    speedup = result['per_cpu_second'] / results['pbkdf2']['per_cpu_second']
+                    self.stdout.write(self.style.SUCCESS(f"{name}: {speedup:.1f}x the logins of pbkdf2 per core"))
+
+    def available(self, name):
+        if name == 'argon2' and importlib.util.find_spec('argon2') is None:
+            self.stderr.write("Skipping argon2, install argon2-cffi to include it")
+            return False
+        return True
+
+    def run(self, name, repeat):
+        with override_settings(PASSWORD_HASHERS=[HASHERS[name]]):
+            provision_user(f'bench-{name}', PASSWORD)
+            client = Client()
+            credentials = {'username': f'bench-{name}', 'password': PASSWORD}
+
+            def login():
+                response = client.post('/api/auth/', credentials, content_type='application/json')
+                assert response.status_code == 200, response.content
+
+            login()
+            timings = []
+            cpu_started = time.process_time()
+            for _ in range(repeat):
+                started = time.perf_counter()
+                login()
+                timings.append((time.perf_counter() - started) * 1000)
+            cpu = time.process_time() - cpu_started
+
+        return {
+            'per_cpu_second': repeat / cpu if cpu else 0.0,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+        }
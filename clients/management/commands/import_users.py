@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.services import IMPORT_FIELDS, bulk_provision_users, read_user_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with their profiles and role groups from a CSV file with the columns "
+        + ", ".join(IMPORT_FIELDS)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = bulk_provision_users(read_user_rows(stream), chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} users, {len(result['errors'])} rows rejected"
+        ))
@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 # User profile to extend the default User model with role-based functionality
@@ -50,24 +50,46 @@ class ShoppingListItem(models.Model):
 
 # Auto-create user profile when a user is created
 def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        UserProfile.objects.get_or_create(user=instance)
-
-        # Add to appropriate group based on role
-        profile = UserProfile.objects.get(user=instance)
-        if profile.role == 'customer':
-            group, created = Group.objects.get_or_create(name='Customer')
-            instance.groups.add(group)
-        elif profile.role == 'seller':
-            group, created = Group.objects.get_or_create(name='Seller')
-            instance.groups.add(group)
-        elif profile.role == 'admin':
-            group, created = Group.objects.get_or_create(name='Admin')
-            instance.groups.add(group)
+    # Users made by clients.services.provision_user already have theirs
+    if created and not getattr(instance, '_provisioned', False):
+        from .services import provision_profile
+        provision_profile(instance)
 
 post_save.connect(create_user_profile, sender=User)
 
-    
 
+def forget_group_ids(sender, **kwargs):
+    from .services import forget_group_ids
+    forget_group_ids()
 
-    
+post_delete.connect(forget_group_ids, sender=Group)
+post_migrate.connect(forget_group_ids)
+
+
+# Keep the cached role lookups used by the authentication and permission classes fresh
+def cache_user_profile(sender, instance, **kwargs):
+    from .authentication import ProfileInfo, profile_cache
+    if UserProfile.user.is_cached(instance):
+        profile_cache.set(
+            instance.user_id, ProfileInfo(instance.role, instance.is_seller_approved, instance.user.is_active)
+        )
+    else:
+        profile_cache.delete(instance.user_id)
+
+
+def forget_user_profile(sender, instance, **kwargs):
+    from .authentication import profile_cache
+    profile_cache.delete(instance.user_id)
+
+
+def forget_user(sender, instance, created=False, update_fields=None, **kwargs):
+    # New users were just cached with their profile, logins only save last_login
+    if created or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    from .authentication import profile_cache
+    profile_cache.delete(instance.pk)
+
+post_save.connect(cache_user_profile, sender=UserProfile)
+post_delete.connect(forget_user_profile, sender=UserProfile)
+post_save.connect(forget_user, sender=User)
+post_delete.connect(forget_user, sender=User)
@@ -1,10 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import models
 from .models import UserProfile, ShoppingList, ShoppingListItem
+from .services import group_id, provision_user
 from products.models import Products, Order
+from products.serializers import ImageVariantsField, OrderItemSerializer
 
 
 User = get_user_model()
@@ -19,25 +22,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ('username', 'email', 'password', 'first_name', 'last_name', 'role')
 
     def create(self, validated_data):
-        role = validated_data.pop('role', 'customer')
-        user = User.objects.create_user(**validated_data)
-
-        # Update user profile with role
-        profile, created = UserProfile.objects.get_or_create(user=user)
-        profile.role = role
-        profile.save()
-
-        # Add to appropriate group
-        if role == 'customer':
-            group, created = Group.objects.get_or_create(name='Customer')
-            user.groups.add(group)
-        elif role == 'seller':
-            group, created = Group.objects.get_or_create(name='Seller')
-            user.groups.add(group)
-        elif role == 'admin':
-            group, created = Group.objects.get_or_create(name='Admin')
-            user.groups.add(group)
-        return user
+        # User, profile and role group in one transaction
+        return provision_user(**validated_data)
 
 
 class UserLoginSerializer(serializers.Serializer):
@@ -62,6 +48,17 @@ class ShoppingListSerializer(serializers.ModelSerializer):
         read_only_fields = ('user', 'created_at', 'updated_at')
 
 
+class ShoppingListItemListSerializer(serializers.ListSerializer):
+    """Loads every product referenced by the items with a single query"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.products = Products.all_objects.only('id', 'name', 'price').in_bulk(
+            {item.product_id for item in items}
+        )
+        return super().to_representation(items)
+
+
 class ShoppingListItemSerializer(serializers.ModelSerializer):
     product_name = serializers.SerializerMethodField()
     product_price = serializers.SerializerMethodField()
@@ -70,20 +67,29 @@ class ShoppingListItemSerializer(serializers.ModelSerializer):
         model = ShoppingListItem
         fields = ('id', 'shopping_list', 'product_id', 'product_name', 'product_price', 'quantity', 'added_at')
         read_only_fields = ('added_at',)
+        list_serializer_class = ShoppingListItemListSerializer
+
+    def get_product(self, obj):
+        if not hasattr(obj, '_product'):
+            products = getattr(self.parent, 'products', None)
+            if products is not None:
+                obj._product = products.get(obj.product_id)
+            else:
+                # Serialized on its own, e.g. after a create
+                obj._product = Products.all_objects.only('id', 'name', 'price').filter(id=obj.product_id).first()
+        return obj._product
 
     def get_product_name(self, obj):
-        try:
-            product = Products.objects.get(id=obj.product_id)
-            return product.name
-        except Products.DoesNotExist:
+        product = self.get_product(obj)
+        if product is None:
             return f"Product ID {obj.product_id} (not found)"
+        return product.name
 
     def get_product_price(self, obj):
-        try:
-            product = Products.objects.get(id=obj.product_id)
-            return float(product.price)
-        except Products.DoesNotExist:
+        product = self.get_product(obj)
+        if product is None:
             return 0.0
+        return float(product.price)
 
 
 class ShoppingListDetailSerializer(serializers.ModelSerializer):
@@ -141,13 +147,14 @@ class SellerApprovalSerializer(serializers.ModelSerializer):
         
         if is_seller_approved and profile.role == 'seller':
             # Add to Seller group when approved
-            seller_group, created = Group.objects.get_or_create(name='Seller')
-            instance.groups.add(seller_group)
+            instance.groups.add(group_id('seller'))
         return instance
 
 
 # Serializers for product and order views
 class ProductSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Products
         exclude = ('deleted_at',)  # Exclude the soft delete field from API responses
@@ -157,4 +164,13 @@ class ProductSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class SellerOrderSerializer(serializers.ModelSerializer):
+    """An order as one seller sees it: only the items of that seller's products"""
+    order_items = OrderItemSerializer(many=True, read_only=True, source='seller_items')
+
+    class Meta:
+        model = Order
+        fields = ('number', 'created_at', 'updated_at', 'status', 'payment', 'user', 'order_items')
@@ -0,0 +1,173 @@
+"""
+User provisioning: the user row, its profile and its role group in one
+transaction, three INSERTs in total.
+
+Group primary keys are looked up once per process and kept in memory,
+deleting a group or flushing the database drops them again (see
+clients.models).
+"""
+import csv
+import io
+import threading
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+
+from .models import UserProfile
+
+User = get_user_model()
+
+ROLE_GROUPS = {
+    'customer': 'Customer',
+    'seller': 'Seller',
+    'admin': 'Admin',
+}
+IMPORT_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name', 'role', 'is_seller_approved')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+_group_ids = {}
+_group_lock = threading.Lock()
+
+
+def group_id(role):
+    """Primary key of the group of a role, created on first use"""
+    name = ROLE_GROUPS[role]
+    pk = _group_ids.get(name)
+    if pk is None:
+        pk = Group.objects.get_or_create(name=name)[0].pk
+        # Only remembered once committed, a group created by a rolled back transaction is gone
+        transaction.on_commit(lambda: _remember_group_id(name, pk))
+    return pk
+
+
+def _remember_group_id(name, pk):
+    with _group_lock:
+        _group_ids[name] = pk
+
+
+def forget_group_ids():
+    with _group_lock:
+        _group_ids.clear()
+
+
+def add_to_role_group(user, role):
+    # Through row directly: groups.add() would first select the memberships the user already has
+    User.groups.through.objects.create(user_id=user.pk, group_id=group_id(role))
+
+
+def _create_profile(user, role, is_seller_approved):
+    profile = UserProfile.objects.create(user=user, role=role, is_seller_approved=is_seller_approved)
+    add_to_role_group(user, role)
+    return profile
+
+
+def provision_profile(user, role='customer', is_seller_approved=False):
+    """Give an existing user without a profile its profile and role group"""
+    with transaction.atomic():
+        return _create_profile(user, role, is_seller_approved)
+
+
+def provision_user(username, password=None, role='customer', is_seller_approved=False, **fields):
+    """Create a user with its profile and role group, the User.objects.create_user of this project"""
+    if role not in ROLE_GROUPS:
+        raise ValueError(f"Unknown role {role}")
+    email = User.objects.normalize_email(fields.pop('email', ''))
+    user = User(username=User.normalize_username(username), email=email, **fields)
+    user.set_password(password)
+    # Tells the post_save handler the profile is taken care of here
+    user._provisioned = True
+    with transaction.atomic():
+        user.save()
+        # Also caches the profile on user.userprofile
+        _create_profile(user, role, is_seller_approved)
+    return user
+
+
+def read_user_rows(stream):
+    """Yield (line, row) from a CSV file of users, see IMPORT_FIELDS for the columns"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None or 'username' not in reader.fieldnames:
+        raise ValueError("The CSV header must contain at least a username column")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _clean_row(row):
+    username = User.normalize_username((row.get('username') or '').strip())
+    if not username:
+        raise ValueError("username is required")
+    role = (row.get('role') or 'customer').strip().lower()
+    if role not in ROLE_GROUPS:
+        raise ValueError(f"unknown role {role}")
+    user = User(
+        username=username,
+        email=User.objects.normalize_email((row.get('email') or '').strip()),
+        first_name=(row.get('first_name') or '').strip(),
+        last_name=(row.get('last_name') or '').strip(),
+    )
+    # Without a password the user has to reset it before logging in
+    user.set_password(row.get('password') or None)
+    is_seller_approved = (row.get('is_seller_approved') or '').strip().lower() in TRUE_VALUES
+    return user, role, is_seller_approved
+
+
+def bulk_provision_users(rows, chunk_size=500):
+    """
+    Create users from (line, row) pairs with bulk_create: per chunk one
+    INSERT each for the users, profiles and group memberships. Usernames
+    that exist already or repeat in the file are rejected.
+    Returns {'created', 'errors'}, every error names the line it came from.
+    """
+    result = {'created': 0, 'errors': []}
+    chunk = []
+    for line, row in rows:
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            result['created'] += _provision_chunk(chunk, result['errors'])
+            chunk = []
+    if chunk:
+        result['created'] += _provision_chunk(chunk, result['errors'])
+    result['errors'].sort(key=lambda error: error['line'])
+    return result
+
+
+def _provision_chunk(rows, errors):
+    valid = {}
+    for line, row in rows:
+        try:
+            user, role, is_seller_approved = _clean_row(row)
+        except ValueError as e:
+            errors.append({'line': line, 'error': str(e)})
+            continue
+        if user.username in valid:
+            errors.append({'line': line, 'error': f"username {user.username} repeats line {valid[user.username][0]}"})
+            continue
+        valid[user.username] = (line, user, role, is_seller_approved)
+
+    taken = set(User.objects.filter(username__in=valid).values_list('username', flat=True))
+    for username in [username for username in valid if username in taken]:
+        line = valid.pop(username)[0]
+        errors.append({'line': line, 'error': f"username {username} already exists"})
+    if not valid:
+        return 0
+
+    group_ids = {role: group_id(role) for role in {entry[2] for entry in valid.values()}}
+    with transaction.atomic():
+        users = User.objects.bulk_create([entry[1] for entry in valid.values()])
+        if any(user.pk is None for user in users):
+            # Backends that cannot return the new primary keys
+            pks = dict(User.objects.filter(username__in=valid).values_list('username', 'pk'))
+            for user in users:
+                user.pk = pks[user.username]
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=user.pk, role=role, is_seller_approved=is_seller_approved)
+            for _, user, role, is_seller_approved in valid.values()
+        ])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.pk, group_id=group_ids[role])
+            for _, user, role, _ in valid.values()
+        ])
+    return len(users)
@@ -1,3 +1,320 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from discounts.models import SellerDailySales
+from products.models import Order, Products, SellerOrder
+from products.serializers import OrderSerializer
+from products.services import place_order
+from .models import ShoppingList, ShoppingListItem, UserProfile
+from .services import provision_user
+from .throttling import login_buckets
+from .views import get_tokens_for_user
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        profile = self.seller.userprofile
+        profile.role = 'seller'
+        profile.is_seller_approved = True
+        profile.save()
+        Products.objects.create(name='Mango', price=10, stock=5, user=self.seller)
+
+    def login(self, username):
+        response = self.client.post('/api/auth/', {'username': username, 'password': 'pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['tokens']['access']
+
+    def test_permission_checks_use_the_profile_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("seller")}')
+        # Only the product list itself, neither the user nor the profile is loaded
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/seller/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+        cache.clear()
+        with self.assertNumQueries(2):
+            self.client.get('/api/auth/seller/products/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/seller/products/')
+
+    def test_tokens_do_not_carry_the_role(self):
+        token = AccessToken(self.login('seller'))
+        self.assertNotIn('role', token)
+        self.assertNotIn('is_seller_approved', token)
+
+    def test_principal_filters_without_loading_the_user(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        ShoppingList.objects.create(name='Groceries', user=customer)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("customer")}')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/shopping-lists/')
+        self.assertEqual(response.data[0]['name'], 'Groceries')
+
+    def test_revoked_sellers_stay_revoked(self):
+        token = self.login('seller')
+        refresh = self.client.post('/api/auth/', {'username': 'seller', 'password': 'pass'}, format='json')
+        refresh = refresh.data['tokens']['refresh']
+        profile = self.seller.userprofile
+        profile.is_seller_approved = False
+        profile.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/api/auth/seller/products/').status_code, 403)
+
+        # Not even once the cached profile is gone, or with a freshly refreshed token
+        cache.clear()
+        self.assertEqual(self.client.get('/api/auth/seller/products/').status_code, 403)
+        access = str(RefreshToken(refresh).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/auth/seller/products/').status_code, 403)
+
+    def test_deactivated_and_deleted_users_are_turned_away(self):
+        token = self.login('seller')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/api/orders/').status_code, 200)
+
+        self.seller.is_active = False
+        self.seller.save()
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_inactive')
+
+        self.seller.delete()
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_not_found')
+
+    def test_views_needing_the_user_load_it(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login("seller")}')
+        response = self.client.get('/api/auth/')
+        self.assertEqual(response.data['username'], 'seller')
+        self.assertEqual(response.data['role'], 'seller')
+
+
+class ShoppingListItemTests(APITestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.client.force_authenticate(self.customer)
+        seller = User.objects.create_user(username='seller', password='pass')
+        products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=i + 1, stock=10, user=seller) for i in range(200)
+        ])
+        self.shopping_list = ShoppingList.objects.create(name='Groceries', user=self.customer)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(shopping_list=self.shopping_list, product_id=product.id) for product in products
+        ])
+        ShoppingListItem.objects.create(shopping_list=self.shopping_list, product_id=999999)
+
+    def test_list_detail_hydrates_products_in_one_query(self):
+        # shopping list, its items, their products
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/auth/shopping-lists/{self.shopping_list.id}/')
+        items = response.data['items']
+        self.assertEqual(len(items), 201)
+        self.assertEqual(items[0]['product_name'], 'Product 0')
+        self.assertEqual(items[-1]['product_name'], 'Product ID 999999 (not found)')
+
+    def test_item_list_hydrates_products_in_one_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/auth/shopping-lists/{self.shopping_list.id}/items/')
+        self.assertEqual(len(response.data), 201)
+        self.assertEqual(response.data[199]['product_price'], 200.0)
+
+    def test_single_item_looks_its_product_up_once(self):
+        product = Products.objects.get(name='Product 4')
+        item = ShoppingListItem.objects.get(product_id=product.id)
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/auth/shopping-lists/{self.shopping_list.id}/items/{item.id}/')
+        self.assertEqual(response.data['product_price'], 5.0)
+
+
+class SellerOrderInboxTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        profile = self.seller.userprofile
+        profile.role = 'seller'
+        profile.is_seller_approved = True
+        profile.save()
+        other_seller = User.objects.create_user(username='other', password='pass')
+        customer = User.objects.create_user(username='customer', password='pass')
+        self.mango = Products.objects.create(name='Mango', price=10, stock=1000, user=self.seller)
+        self.apple = Products.objects.create(name='Apple', price=5, stock=1000, user=other_seller)
+
+        self.orders = [
+            place_order(customer, 'Cash on Delivery', [
+                {'product_id': self.mango.id, 'quantity': 1}, {'product_id': self.apple.id, 'quantity': 2},
+            ])
+            for _ in range(30)
+        ]
+        self.foreign_order = place_order(customer, 'Cash on Delivery', [{'product_id': self.apple.id}])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(self.seller)['access']}")
+
+    def test_inbox_pages_cost_the_same_queries(self):
+        # the page of links with their orders, then the seller's items of those orders
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/auth/seller/orders/?page_size=20')
+        self.assertEqual(len(first.data['results']), 20)
+        with self.assertNumQueries(2):
+            second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 10)
+        self.assertIsNone(second.data['next'])
+
+        numbers = [order['number'] for order in first.data['results'] + second.data['results']]
+        self.assertEqual(set(numbers), {str(order.number) for order in self.orders})
+        for order in first.data['results']:
+            self.assertEqual([item['product'] for item in order['order_items']], [self.mango.id])
+
+    def test_detail_only_shows_the_sellers_items(self):
+        response = self.client.get(f'/api/auth/seller/orders/{self.orders[0].number}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['order_items']), 1)
+        response = self.client.get(f'/api/auth/seller/orders/{self.foreign_order.number}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_matches_the_links_written_by_place_order(self):
+        written = set(SellerOrder.objects.values_list('seller_id', 'order_id', 'created_at'))
+        self.assertEqual(SellerOrder.rebuild(), len(written))
+        self.assertEqual(set(SellerOrder.objects.values_list('seller_id', 'order_id', 'created_at')), written)
+        Order.objects.filter(pk=self.orders[0].pk).delete()
+        self.assertFalse(SellerOrder.objects.filter(order_id=self.orders[0].pk).exists())
+
+
+    def test_orders_placed_in_the_same_millisecond_are_not_skipped(self):
+        created_at = timezone.now().replace(microsecond=456000)
+        for n, order in enumerate(self.orders[:6]):
+            SellerOrder.objects.filter(order=order).update(created_at=created_at + datetime.timedelta(microseconds=n))
+        numbers = []
+        url = '/api/auth/seller/orders/?page_size=4'
+        while url:
+            response = self.client.get(url)
+            numbers += [order['number'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(numbers), sorted(str(order.number) for order in self.orders))
+
+    def test_serializer_created_orders_go_through_place_order(self):
+        customer = User.objects.get(username='customer')
+        serializer = OrderSerializer(data={'payment': 'Cash on Delivery', 'items': [
+            {'product_id': self.mango.id, 'quantity': 2},
+        ]})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(user=customer)
+        self.assertTrue(SellerOrder.objects.filter(seller=self.seller, order=order).exists())
+        self.assertEqual(order.order_item.get().unit_price, 10)
+        self.assertEqual(SellerDailySales.objects.get(seller=self.seller).item_count, len(self.orders) + 1)
+
+class UserProvisioningTests(APITestCase):
+    def groups(self, user):
+        return list(user.groups.values_list('name', flat=True))
+
+    def test_registration_writes_user_profile_and_group_once(self):
+        Group.objects.create(name='Seller')
+        # username check, then user, profile, group lookup and membership in one savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/auth/', {
+                'username': 'ana', 'email': 'ana@example.com', 'password': 'Secret-pass-1', 'role': 'seller',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user']['role'], 'seller')
+        user = User.objects.get(username='ana')
+        self.assertTrue(user.check_password('Secret-pass-1'))
+        self.assertEqual(self.groups(user), ['Seller'])
+        self.assertEqual(UserProfile.objects.filter(user=user).count(), 1)
+
+    def test_seller_registration_is_not_approved(self):
+        response = self.client.post('/api/auth/seller/register/', {
+            'username': 'ben', 'email': 'ben@example.com', 'password': 'Secret-pass-1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        profile = UserProfile.objects.get(user__username='ben')
+        self.assertEqual((profile.role, profile.is_seller_approved), ('seller', False))
+        self.assertEqual(response.data['user']['is_seller_approved'], False)
+
+    def test_users_created_elsewhere_still_get_a_profile(self):
+        user = User.objects.create_user(username='cy', password='pass')
+        self.assertEqual(user.userprofile.role, 'customer')
+        self.assertEqual(self.groups(user), ['Customer'])
+        provisioned = provision_user('dee', 'pass', role='admin')
+        self.assertEqual(self.groups(provisioned), ['Admin'])
+
+    def test_import_users_from_csv(self):
+        provision_user('taken', 'pass')
+        rows = [
+            'username,email,password,first_name,last_name,role,is_seller_approved',
+            'eve,eve@example.com,Secret-pass-1,Eve,Tan,seller,yes',
+            *[f'user{i},user{i}@example.com,,,,customer,' for i in range(20)],
+            'taken,,,,,customer,',
+            'user3,,,,,customer,',
+            'zed,,,,,wizard,',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('\n'.join(rows))
+        self.addCleanup(os.remove, csv_file.name)
+
+        with tempfile.TemporaryFile('w+') as errors:
+            call_command('import_users', csv_file.name, chunk_size=10, stdout=open(os.devnull, 'w'), stderr=errors)
+            errors.seek(0)
+            reported = errors.read().splitlines()
+        self.assertEqual(reported, [
+            'line 23: username taken already exists',
+            'line 24: username user3 already exists',
+            'line 25: unknown role wizard',
+        ])
+
+        eve = User.objects.get(username='eve')
+        self.assertTrue(eve.check_password('Secret-pass-1'))
+        self.assertEqual((eve.userprofile.role, eve.userprofile.is_seller_approved), ('seller', True))
+        self.assertEqual(self.groups(eve), ['Seller'])
+        imported = User.objects.filter(username__startswith='user')
+        self.assertEqual(imported.count(), 20)
+        self.assertFalse(imported[0].has_usable_password())
+        self.assertEqual(Group.objects.get(name='Customer').user_set.count(), 21)
+
+
+class LoginTests(APITestCase):
+    def setUp(self):
+        login_buckets.clear()
+        self.user = provision_user('ana', 'Secret-pass-1')
+
+    def login(self, password, username='ana'):
+        return self.client.post('/api/auth/', {'username': username, 'password': password}, format='json')
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('Secret-pass-1', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login('Secret-pass-1').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$32768$'))
+        self.assertTrue(self.user.check_password('Secret-pass-1'))
+
+    @override_settings(LOGIN_THROTTLE_USERNAME=(2, 0.001))
+    def test_failed_logins_throttle_the_username(self):
+        provision_user('ben', 'Secret-pass-1')
+        # Successful logins do not count
+        for _ in range(3):
+            self.assertEqual(self.login('Secret-pass-1').status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        response = self.login('Secret-pass-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.login('Secret-pass-1', username='ben').status_code, 200)
+
+    @override_settings(LOGIN_THROTTLE_IP=(3, 0.001))
+    def test_logins_are_throttled_per_ip_but_registration_is_not(self):
+        for _ in range(3):
+            self.assertEqual(self.login('Secret-pass-1').status_code, 200)
+        self.assertEqual(self.login('Secret-pass-1').status_code, 429)
+        response = self.client.post('/api/auth/', {
+            'username': 'cy', 'email': 'cy@example.com', 'password': 'Secret-pass-1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
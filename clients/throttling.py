@@ -0,0 +1,74 @@
+"""
+Login rate limiting with in-process token buckets.
+
+Every login attempt takes a token from the bucket of the client's IP, so a
+burst of logins cannot keep the CPU busy hashing passwords. Failed attempts
+also take one from the bucket of the username, which slows down password
+guessing without locking out a user who types their password right.
+Buckets live in the process, each worker counts on its own.
+"""
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBuckets:
+    """Token buckets by key, each (burst, rate) bucket starts full and refills ``rate`` tokens per second"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, burst, rate, now):
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated_at) * rate)
+
+    def take(self, key, burst, rate):
+        """Take a token, return 0 or the seconds until one is available (nothing is taken then)"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._tokens(key, burst, rate, now)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+
+    def peek(self, key, burst, rate):
+        """Like take() without taking anything"""
+        with self._lock:
+            tokens = self._tokens(key, burst, rate, time.monotonic())
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+login_buckets = TokenBuckets()
+
+
+def _username_key(username):
+    return f'username:{str(username).lower()}'
+
+
+def login_failed(username):
+    """Charge a failed login to the username's bucket"""
+    if username:
+        login_buckets.take(_username_key(username), *settings.LOGIN_THROTTLE_USERNAME)
+
+
+class LoginThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        self.wait_seconds = login_buckets.take(f'ip:{self.get_ident(request)}', *settings.LOGIN_THROTTLE_IP)
+        username = request.data.get('username')
+        if not self.wait_seconds and username:
+            self.wait_seconds = login_buckets.peek(_username_key(username), *settings.LOGIN_THROTTLE_USERNAME)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
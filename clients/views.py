@@ -3,17 +3,21 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, DjangoModelPermissions
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate, get_user_model
-from django.db.models import Q
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.http import HttpResponse
 
-from .models import UserProfile, ShoppingList, ShoppingListItem
+from core.routers import ReplicaReadMixin
+from .authentication import get_profile_info
+from .throttling import LoginThrottle, login_failed
+from .models import ShoppingList, ShoppingListItem
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserSerializer,
     ShoppingListSerializer, ShoppingListDetailSerializer,
-    ShoppingListItemSerializer, ProductSerializer, OrderSerializer,
+    ShoppingListItemSerializer, ProductSerializer, SellerOrderSerializer,
     SellerApprovalSerializer, AdminUserManagementSerializer
 )
-from products.models import Products, Order, OrderItem
+from products.models import Products, Order, OrderItem, SellerOrder
+from products.pagination import SellerOrderPagination
 
 User = get_user_model()
 
@@ -31,10 +35,8 @@ class RoleBasedPermission(IsAuthenticated):
     def has_permission(self, request, view):
         if not super().has_permission(request, view):
             return False
-        try:
-            return request.user.userprofile.role in self.allowed_roles
-        except UserProfile.DoesNotExist:
-            return False
+        info = get_profile_info(request.user)
+        return info is not None and info.role in self.allowed_roles
 
 
 class IsCustomer(RoleBasedPermission):
@@ -47,11 +49,7 @@ class IsSeller(RoleBasedPermission):
     def has_permission(self, request, view):
         if not super().has_permission(request, view):
             return False
-        try:
-            profile = request.user.userprofile
-            return profile.role == 'seller' and profile.is_seller_approved
-        except UserProfile.DoesNotExist:
-            return False
+        return get_profile_info(request.user).is_seller_approved
 
 
 class IsAdmin(RoleBasedPermission):
@@ -75,12 +73,14 @@ class RegisterView(generics.CreateAPIView):
 
 class LoginView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginThrottle]
 
     def post(self, request):
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = authenticate(**serializer.validated_data)
         if not user:
+            login_failed(serializer.validated_data['username'])
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
         return Response({
@@ -173,7 +173,7 @@ class SellerProductView(generics.ListCreateAPIView, generics.RetrieveUpdateDestr
     permission_classes = [IsSeller]
 
     def get_queryset(self):
-        return Products.objects.filter(user=self.request.user, deleted_at__isnull=True)
+        return Products.catalog.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -182,22 +182,37 @@ class SellerProductView(generics.ListCreateAPIView, generics.RetrieveUpdateDestr
         instance.delete(soft=True)  # soft delete
 
 
-class SellerOrderListView(generics.ListAPIView):
-    serializer_class = OrderSerializer
+def seller_items(seller):
+    """Prefetch of only the seller's own items of each order, into order.seller_items"""
+    return Prefetch('order_item', queryset=OrderItem.objects.filter(product__user=seller), to_attr='seller_items')
+
+
+class SellerOrderListView(ReplicaReadMixin, generics.ListAPIView):
+    """The seller's order inbox, newest first: two queries per page however long the history is"""
+    serializer_class = SellerOrderSerializer
     permission_classes = [IsSeller]
+    pagination_class = SellerOrderPagination
 
     def get_queryset(self):
-        seller_products = Products.objects.filter(user=self.request.user, deleted_at__isnull=True)
-        return Order.objects.filter(order_item__product__in=seller_products).distinct()
+        return SellerOrder.objects.filter(seller=self.request.user).select_related('order')
+
+    def list(self, request, *args, **kwargs):
+        links = self.paginate_queryset(self.get_queryset())
+        orders = [link.order for link in links]
+        prefetch_related_objects(orders, seller_items(request.user))
+        serializer = self.get_serializer(orders, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class SellerOrderDetailView(generics.RetrieveAPIView):
-    serializer_class = OrderSerializer
+    serializer_class = SellerOrderSerializer
     permission_classes = [IsSeller]
 
     def get_queryset(self):
-        seller_products = Products.objects.filter(user=self.request.user, deleted_at__isnull=True)
-        return Order.objects.filter(order_item__product__in=seller_products).distinct()
+        # At most one link per seller and order, no DISTINCT needed
+        return Order.objects.filter(seller_links__seller=self.request.user).prefetch_related(
+            seller_items(self.request.user)
+        )
 
 
 class SellerRegistrationView(generics.CreateAPIView):
@@ -206,23 +221,13 @@ class SellerRegistrationView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        # Update profile to seller but not approved yet
-        profile = user.userprofile
-        profile.role = 'seller'
-        profile.is_seller_approved = False
-        profile.save()
+        # Seller but not approved yet
+        return serializer.save(role='seller', is_seller_approved=False)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-
-        # Update profile to seller but not approved yet
-        profile = user.userprofile
-        profile.role = 'seller'
-        profile.is_seller_approved = False
-        profile.save()
+        user = self.perform_create(serializer)
 
         return Response({
             "tokens": get_tokens_for_user(user),
@@ -246,6 +251,11 @@ class AuthView(views.APIView):
         )
 
         if action == 'login' or is_login_attempt:
+            # Throttled here only, the same endpoint also registers users
+            throttle = LoginThrottle()
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+
             # Use the same login logic
             # Create a data dict that matches LoginSerializer expectations
             login_data = {
@@ -262,6 +272,7 @@ class AuthView(views.APIView):
             user = authenticate(username=username, password=password)
 
             if user is None:
+                login_failed(username)
                 return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
             tokens = get_tokens_for_user(user)
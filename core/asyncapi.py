@@ -0,0 +1,73 @@
+"""
+Helpers for the native async endpoints under /api/async/.
+
+DRF views are synchronous: under ASGI every request to one runs in the
+single thread behind Django's thread-sensitive sync adapter. The async
+endpoints are plain Django ``async def`` views instead. They authenticate
+like the DRF views, with clients.authentication.ClaimsJWTAuthentication
+(user id from the JWT, deleted and deactivated users turned away from the
+profile cache), read through the async ORM and answer with the body their
+DRF counterpart would send. Only GET and HEAD are served, writes stay on
+the DRF endpoints.
+"""
+import contextlib
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
+
+from clients.authentication import ClaimsJWTAuthentication
+from core.routers import ais_sticky, replica_reads
+
+_authentication = ClaimsJWTAuthentication()
+
+
+def json_response(data, status=200, **kwargs):
+    # DRF's encoder, so decimals and dates come out as from the DRF views
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False, **kwargs)
+
+
+def error_response(request, exc):
+    """The response DRF's exception handler would give for an APIException"""
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    headers = {}
+    if exc.status_code == 401:
+        headers['WWW-Authenticate'] = _authentication.authenticate_header(request)
+    return json_response(data, status=exc.status_code, headers=headers)
+
+
+def async_api_view(authenticated=True, replica=False):
+    """
+    Turn an ``async def view(request, ...)`` into a GET/HEAD endpoint.
+    request.user becomes the token principal; with ``authenticated`` a
+    request without a valid token gets a 401. ``replica`` sends the reads
+    to a read replica, like core.routers.ReplicaReadMixin. APIExceptions
+    raised by the view (validation errors, bad cursors) become their usual
+    error responses.
+    """
+    def decorator(view):
+        @require_safe
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                # The User row is never loaded by these views, but a cache miss queries the database
+                result = await sync_to_async(_authentication.authenticate)(request)
+                if result is None and authenticated:
+                    raise NotAuthenticated()
+                user = result[0] if result is not None else None
+                if user is not None:
+                    request.user = user
+
+                reads = contextlib.nullcontext()
+                if replica and settings.DATABASE_REPLICAS and not await ais_sticky(user):
+                    reads = replica_reads()
+                with reads:
+                    return await view(request, *args, **kwargs)
+            except APIException as e:
+                return error_response(request, e)
+        return wrapper
+    return decorator
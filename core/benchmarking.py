@@ -0,0 +1,59 @@
+"""Helpers shared by the benchmark_* management commands"""
+import contextlib
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """Run the block against a freshly migrated test database that is dropped afterwards"""
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def measure(func, repeat=20, warmup=1):
+    """Call func repeatedly and report latency, query count and peak traced memory"""
+    for _ in range(warmup):
+        func()
+
+    timings, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+
+    # tracemalloc slows everything down, so memory gets its own pass
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': statistics.median(timings),
+        'p95_ms': percentile(timings, 95),
+        'queries': queries,
+        'peak_kb': peak / 1024,
+    }
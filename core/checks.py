@@ -0,0 +1,38 @@
+"""System checks for settings that only break once more than one worker runs"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _local_cache():
+    return settings.CACHES['default']['BACKEND'] in LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    # The version bumps of products.cache would only reach the worker that made the write
+    if _local_cache() and settings.PRODUCT_CACHE_TIMEOUT:
+        return [Warning(
+            "The product response cache is on with a per-process cache backend, other workers "
+            "serve stale products for up to PRODUCT_CACHE_TIMEOUT seconds.",
+            hint="Configure a shared CACHE_BACKEND or set PRODUCT_CACHE_TIMEOUT=0.",
+            id='core.W001',
+        )]
+    return []
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_stickiness(app_configs, **kwargs):
+    # core.routers keeps the "wrote recently" marks in the cache, the next request may hit another worker
+    if _local_cache() and settings.DATABASE_REPLICAS:
+        return [Error(
+            "Read replicas need a cache shared by all workers, with a per-process cache a user's "
+            "next read can miss their own write.",
+            hint="Configure a shared CACHE_BACKEND (the file based default, Redis, ...).",
+            id='core.E001',
+        )]
+    return []
@@ -0,0 +1,30 @@
+"""Per-connection database setup and SQLite replica copies"""
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply settings.SQLITE_PRAGMAS to every new SQLite connection. WAL lets
+    readers run alongside the single writer, busy_timeout makes writers wait
+    for the lock instead of failing with "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def copy_sqlite_database(source_alias, target_alias):
+    """Copy the whole source SQLite database over the target with the online backup API"""
+    source = connections[source_alias]
+    source.ensure_connection()
+    target = sqlite3.connect(connections[target_alias].settings_dict['NAME'])
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+    # Open connections to the target would keep serving their old snapshot
+    connections[target_alias].close()
@@ -0,0 +1,224 @@
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Count
+
+from clients.views import get_tokens_for_user
+from core.benchmarking import percentile
+
+ENDPOINTS = {
+    # name: (DRF view, native async view)
+    'orders': ('/api/orders/', '/api/async/orders/'),
+    'products': ('/api/product/', '/api/async/product/'),
+    'discount-days': ('/api/discount-day/', '/api/async/discount-day/'),
+}
+PROFILES = {
+    # name: (server, which view of the endpoint)
+    'wsgi': ('wsgi', 0),
+    'asgi-sync': ('asgi', 0),
+    'asgi': ('asgi', 1),
+}
+# Pieces a slow client sends its request in, spread over --delay seconds
+REQUEST_CHUNKS = 4
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server handing each connection to a fixed pool of threads, like gunicorn's gthread worker"""
+    request_queue_size = 1024
+
+    def __init__(self, *args, threads, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_in_thread, request, client_address)
+
+    def process_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a seeded throwaway database with WSGI worker threads and with ASGI (uvicorn), send many "
+        "concurrent slow clients at each and compare requests/s and tail latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='orders')
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+        parser.add_argument('--clients', type=int, default=200, help="Concurrent clients")
+        parser.add_argument('--requests', type=int, default=5, help="Requests sent by each client, one after another")
+        parser.add_argument('--delay', type=float, default=0.2, help="Seconds a client takes to send a request")
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--prepare', action='store_true', help="Seed the database and print a token (used internally)"
+        )
+        parser.add_argument('--serve-wsgi', action='store_true', help="Run the WSGI server (used internally)")
+
+    def handle(self, *args, **options):
+        if options['prepare']:
+            self.stdout.write(json.dumps(self.prepare()))
+            return
+        if options['serve_wsgi']:
+            self.serve_wsgi(options['port'], options['threads'])
+            return
+
+        profiles = [name for name in options['profiles'] if self.available(name)]
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                'DB_ENGINE': 'django.db.backends.sqlite3',
+                'DB_NAME': str(Path(directory) / 'asgi.sqlite3'),
+                'PYTHONUNBUFFERED': '1',
+            }
+            prepared = self.run_child(env, '--prepare')
+            results = {name: self.run_profile(name, env, prepared['token'], options) for name in profiles}
+
+        self.stdout.write(
+            f"{options['endpoint']}: {options['clients']} clients x {options['requests']} requests, "
+            f"each request sent over {options['delay']}s"
+        )
+        self.stdout.write(f"{'profile':<11}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<11}{result['rps']:>8.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                f"{result['p99_ms']:>9.1f}{result['errors']:>8}"
+            )
+        if 'wsgi' in results and 'asgi' in results and results['wsgi']['rps']:
+            speedup = results['asgi']['rps'] / results['wsgi']['rps']
+            self.stdout.write(self.style.SUCCESS(f"ASGI with async views: {speedup:.1f}x the requests/s of WSGI"))
+
+    def available(self, name):
+        if PROFILES[name][0] == 'asgi' and importlib.util.find_spec('uvicorn') is None:
+            self.stderr.write(f"Skipping {name}, install uvicorn to include it")
+            return False
+        return True
+
+    def run_child(self, env, *arguments):
+        command = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_asgi', *arguments]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"benchmark_asgi {' '.join(arguments)} failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def prepare(self):
+        """Migrate and seed the throwaway database, return a token of the customer with the most orders"""
+        call_command('migrate', verbosity=0)
+        call_command('seed_data', customers=20, sellers=10, products=2000, orders=2000, verbosity=0)
+        customer = User.objects.annotate(orders=Count('order')).order_by('-orders').first()
+        return {'token': get_tokens_for_user(customer)['access']}
+
+    def serve_wsgi(self, port, threads):
+        server = PooledWSGIServer(('127.0.0.1', port), QuietHandler, threads=threads)
+        server.set_app(get_wsgi_application())
+        server.serve_forever()
+
+    def start_server(self, kind, env, options):
+        port = str(options['port'])
+        if kind == 'wsgi':
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_asgi',
+                '--serve-wsgi', '--port', port, '--threads', str(options['threads']),
+            ]
+        else:
+            command = [
+                sys.executable, '-m', 'uvicorn', 'core.asgi:application',
+                '--port', port, '--log-level', 'warning', '--no-access-log', '--backlog', '1024',
+            ]
+        process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', options['port']), timeout=1).close()
+                return process
+            except OSError:
+                if process.poll() is not None:
+                    raise CommandError(f"The {kind} server exited with {process.returncode}")
+                time.sleep(0.2)
+        process.kill()
+        raise CommandError(f"The {kind} server did not start")
+
+    def run_profile(self, name, env, token, options):
+        kind, view = PROFILES[name]
+        path = ENDPOINTS[options['endpoint']][view]
+        process = self.start_server(kind, env, options)
+        try:
+            # One request first, so the first slow clients do not also pay for imports and connections
+            asyncio.run(slow_request(options['port'], path, token, 0))
+            return asyncio.run(load(options['port'], path, token, options))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def slow_request(port, path, token, delay):
+    """One request over a new connection, sent in REQUEST_CHUNKS pieces over ``delay`` seconds"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+            "Accept: application/json\r\nConnection: close\r\n\r\n"
+        ).encode()
+        size = -(-len(request) // REQUEST_CHUNKS)
+        for start in range(0, len(request), size):
+            writer.write(request[start:start + size])
+            await writer.drain()
+            if start + size < len(request):
+                await asyncio.sleep(delay / (REQUEST_CHUNKS - 1))
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = response.split(b' ', 2)[1] if response.startswith(b'HTTP/') else b''
+    if status != b'200':
+        raise ValueError(f"{path} answered {response[:200]!r}")
+
+
+async def load(port, path, token, options):
+    timings, errors = [], []
+
+    async def client():
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(slow_request(port, path, token, options['delay']), timeout=60)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                errors.append(e)
+                continue
+            timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(options['clients'])])
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'errors': len(errors),
+    }
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.database import copy_sqlite_database
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database over every SQLite replica in settings.DATABASE_REPLICAS"
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set DB_REPLICAS")
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("Only SQLite replicas are copied here, other databases replicate themselves")
+        for alias in settings.DATABASE_REPLICAS:
+            copy_sqlite_database('default', alias)
+            self.stdout.write(f"{alias}: {connections[alias].settings_dict['NAME']}")
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(settings.DATABASE_REPLICAS)} replica(s)"))
@@ -0,0 +1,36 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from rest_framework.permissions import SAFE_METHODS
+
+from .routers import mark_sticky
+
+
+class ReplicaStickinessMiddleware:
+    """Keep a user's reads on the primary database for a while after they changed something"""
+    # Async capable, so under ASGI async views are not pushed through a sync adapter
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        # DRF puts the token user on the Django request once the view authenticated it
+        if self.wrote(request, response):
+            mark_sticky(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.wrote(request, response):
+            # request.user may still be the lazy session user, which loads synchronously
+            await sync_to_async(mark_sticky)(getattr(request, 'user', None))
+        return response
+
+    def wrote(self, request, response):
+        return request.method not in SAFE_METHODS and response.status_code < 400
@@ -0,0 +1,94 @@
+"""
+Read replica routing.
+
+Views opt in with ReplicaReadMixin: their GET/HEAD/OPTIONS requests read
+from one of settings.DATABASE_REPLICAS, everything else uses the primary.
+After a user writes (see core.middleware.ReplicaStickinessMiddleware) their
+reads stay on the primary for REPLICA_STICKY_SECONDS, so nobody misses
+their own changes while the replicas catch up. The marks live in the
+default cache, which must be shared by all workers (check core.E001).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def _sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def mark_sticky(user):
+    if user is not None and user.is_authenticated and settings.DATABASE_REPLICAS:
+        cache.set(_sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return user is not None and user.is_authenticated and cache.get(_sticky_key(user.pk), False)
+
+
+async def ais_sticky(user):
+    return user is not None and user.is_authenticated and await cache.aget(_sticky_key(user.pk), False)
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads inside the block to a replica, e.g. in reports run outside a request"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def reading_from_replica():
+    """True while the current request sends its reads to a replica"""
+    return _use_replica.get()
+
+
+class ReplicaReadMixin:
+    """For APIViews whose safe methods only read, and may read slightly stale data"""
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks still read from the primary
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS and not is_sticky(request.user):
+            self._replica_token = _use_replica.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also after unhandled errors, worker threads are reused for the next request
+            if self._replica_token is not None:
+                _use_replica.reset(self._replica_token)
+                self._replica_token = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and _use_replica.get():
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, they get the schema from it
+        return db not in settings.DATABASE_REPLICAS
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
     'corsheaders',
 
     #apps
+    'core',
     'clients',
     'products',
     'discounts',
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -84,13 +87,55 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Configured from the environment, SQLite on db.sqlite3 by default. For PostgreSQL:
+# DB_ENGINE=django.db.backends.postgresql DB_NAME=shop DB_USER=... DB_PASSWORD=... DB_HOST=... DB_PORT=5432
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        # Keep connections open between requests, checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'OPTIONS': {},
     }
 }
 
+# SQLite tuning, applied by core.database on every new connection. WAL mode is stored in the
+# database file and adds -wal/-shm files next to it, db.sqlite3 is kept out of git for that.
+# DB_SQLITE_TUNING=0 turns it off (benchmark_checkout compares both).
+SQLITE_PRAGMAS = {}
+if DB_ENGINE == 'django.db.backends.sqlite3' and os.environ.get('DB_SQLITE_TUNING', '1') == '1':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('DB_SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+        'mmap_size': 128 * 1024 * 1024,
+        'cache_size': -32000,  # KiB
+    }
+    # Take the write lock when a transaction starts, a deferred transaction that
+    # reads first and writes later fails right away when another writer got in
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Read replicas, comma separated: SQLite file names, or host names for other engines.
+# Aliases are replica1, replica2, ...; keep SQLite copies fresh with manage.py sync_replicas
+DATABASE_REPLICAS = []
+for number, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    replica['NAME' if DB_ENGINE == 'django.db.backends.sqlite3' else 'HOST'] = location.strip()
+    DATABASES[f'replica{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -99,6 +144,33 @@ AUTH_PASSWORD_VALIDATORS = [
     # Password validation removed - allowing any password
 ]
 
+# New passwords are hashed with PASSWORD_HASHER: scrypt (default), argon2 (needs argon2-cffi)
+# or pbkdf2 (Django's default, about 3x the CPU time of the scrypt settings below per login).
+# Hashes made by the others still verify and are rehashed on the user's next login
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+_PASSWORD_HASHERS = {
+    'scrypt': 'clients.hashers.TunedScryptPasswordHasher',
+    'argon2': 'clients.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+
+# scrypt: 2**15 x 8 uses 32 MiB per hash. OWASP suggests a work factor of 2**17 where the CPU allows it
+SCRYPT_WORK_FACTOR = int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 15))
+SCRYPT_BLOCK_SIZE = int(os.environ.get('SCRYPT_BLOCK_SIZE', 8))
+SCRYPT_PARALLELISM = int(os.environ.get('SCRYPT_PARALLELISM', 1))
+# argon2id: OWASP's minimum, 2 passes over 19 MiB
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+
+# Login token buckets as (burst, tokens refilled per second). Every attempt costs a token of
+# the client IP's bucket, failed attempts also one of the username's
+LOGIN_THROTTLE_IP = (30, 1.0)
+LOGIN_THROTTLE_USERNAME = (5, 5 / 60)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -127,10 +199,37 @@ MEDIA_ROOT = BASE_DIR / 'media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache. Product versions, role lookups and replica stickiness must be seen by every worker,
+# so it is file based (shared by the processes of one machine) unless configured, e.g. for Redis:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379
+# Tests get a fresh local memory cache from core.test_runner.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'django_cache')),
+    }
+}
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Seconds a cached product list or detail response is kept, 0 turns the response cache off
+PRODUCT_CACHE_TIMEOUT = int(os.environ.get('PRODUCT_CACHE_TIMEOUT', 300))
+
+# Threads resizing uploaded product images, 0 resizes inline after the commit
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('PRODUCT_IMAGE_WORKERS', 2))
+# Largest image (width x height, as decoded) variants are made of, about 100 MB of RGBA per worker
+PRODUCT_IMAGE_MAX_PIXELS = int(os.environ.get('PRODUCT_IMAGE_MAX_PIXELS', 25_000_000))
+
+# manage.py archive_data: gzipped NDJSON goes to ARCHIVE_DIR, rows are archived this many days after
+# being soft deleted (products), placed (orders) or placed and cancelled (cancelled orders)
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', BASE_DIR / 'archive')
+ARCHIVE_PRODUCT_DAYS = int(os.environ.get('ARCHIVE_PRODUCT_DAYS', 30))
+ARCHIVE_ORDER_DAYS = int(os.environ.get('ARCHIVE_ORDER_DAYS', 730))
+ARCHIVE_CANCELLED_ORDER_DAYS = int(os.environ.get('ARCHIVE_CANCELLED_ORDER_DAYS', 90))
+
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'clients.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -153,6 +252,9 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Seconds a user's role and seller approval stay in the cache (0 disables), profile saves update it at once
+PROFILE_CACHE_TTL = 60
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
@@ -0,0 +1,25 @@
+"""Test runner of the project, see TEST_RUNNER in core.settings"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner with a fresh local memory cache in place of the configured
+    one, so tests never read or bump the cache entries of a running server.
+    The tests run in one process, the per-process cache warning (core.W001)
+    does not apply to them.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            SILENCED_SYSTEM_CHECKS=[*settings.SILENCED_SYSTEM_CHECKS, 'core.W001'],
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,115 @@
+import datetime
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from clients.views import get_tokens_for_user
+from discounts.models import DiscountDay
+from .checks import check_replica_stickiness
+from .database import copy_sqlite_database
+from .routers import ReplicaRouter, replica_reads
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_the_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_replica_reads_pick_a_replica(self):
+        with replica_reads():
+            self.assertIn(self.router.db_for_read(User), ['replica1', 'replica2'])
+            self.assertEqual(self.router.db_for_write(User), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'products'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'products'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    filebased = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+
+    def test_replicas_need_a_shared_cache(self):
+        with self.settings(CACHES=self.locmem, DATABASE_REPLICAS=['replica1']):
+            self.assertEqual([error.id for error in check_replica_stickiness(None)], ['core.E001'])
+        with self.settings(CACHES=self.filebased, DATABASE_REPLICAS=['replica1']):
+            self.assertEqual(check_replica_stickiness(None), [])
+        with self.settings(CACHES=self.locmem, DATABASE_REPLICAS=[]):
+            self.assertEqual(check_replica_stickiness(None), [])
+
+
+    def test_tests_run_with_a_local_memory_cache(self):
+        # Swapped in by core.test_runner, whatever CACHE_BACKEND says
+        self.assertIsInstance(caches['default'], LocMemCache)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=60)
+class ReplicaReadTests(TransactionTestCase):
+    """The replica is a SQLite file that only changes when sync() copies the primary over it"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Registered after the test databases are set up, the runner must not create or flush it
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(Path(cls.directory) / 'replica.sqlite3')}
+        connections.settings['replica'] = connections.configure_settings(
+            {'default': connections.settings['default'], 'replica': replica}
+        )['replica']
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        profile = self.seller.userprofile
+        profile.role = 'seller'
+        profile.save()
+        self.sync()
+
+    def sync(self):
+        copy_sqlite_database('default', 'replica')
+
+    def discount_dates(self, client=None):
+        response = (client or APIClient()).get('/api/discount-day/')
+        self.assertEqual(response.status_code, 200)
+        return [day['date'] for day in response.data]
+
+    def test_reads_are_served_by_the_replica(self):
+        DiscountDay.objects.create(seller=self.seller, date=datetime.date(2025, 12, 25), discount_percentage=10)
+        self.assertEqual(self.discount_dates(), [])
+        self.sync()
+        self.assertEqual(self.discount_dates(), ['2025-12-25'])
+
+    def test_writers_read_their_own_writes(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(self.seller)['access']}")
+        response = client.post('/api/discount-day/', {'date': '2025-12-25', 'discount_percentage': '10.00'})
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.discount_dates(client), ['2025-12-25'])
+        # Everybody else keeps reading the replica until it catches up
+        self.assertEqual(self.discount_dates(), [])
@@ -18,8 +18,11 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from products.views import ProductView, ProductRetriveUpdateDelete, CustomerOrderView, PaymentView
-from discounts.views import DiscountDayView, DiscountDayDetailView, SellerStatsView
+from products.views import (
+    ProductView, ProductRetriveUpdateDelete, ProductImportView, ProductExportView, ProductSearchView,
+    CustomerOrderView, PaymentView, async_product_list, async_product_detail, async_order_history,
+)
+from discounts.views import DiscountDayView, DiscountDayDetailView, SellerStatsView, async_discount_day_list
 from clients import views as client_views
 
 
@@ -27,8 +30,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
 
     # Product and Order endpoints
-    path('api/product/', ProductView.as_view()),
+    path('api/product/', ProductView.as_view()),  # ?ordering=&facets=1&min_price=&max_price=&status=&seller=&created_after=&created_before=
     path('api/product/<int:pk>/', ProductRetriveUpdateDelete.as_view()),
+    path('api/product/import/', ProductImportView.as_view()),  # Seller bulk upsert from CSV / NDJSON
+    path('api/product/export/', ProductExportView.as_view()),  # ?type=csv|ndjson
+    path('api/product/search/', ProductSearchView.as_view()),  # ?q=&min_price=&max_price=&status=&seller=
     path('api/orders/', CustomerOrderView.as_view()),  # Handle order creation (POST) and list orders (GET)
     path('api/orders/<uuid:order_number>/', CustomerOrderView.as_view()),  # Handle single order (GET) and delete (DELETE)
     path('api/payment/', PaymentView.as_view()),
@@ -56,6 +62,12 @@ urlpatterns = [
     path('api/discount-day/', DiscountDayView.as_view()),
     path('api/discount-day/<int:pk>/', DiscountDayDetailView.as_view()),
     path('api/seller/stats/', SellerStatsView.as_view()),  # Use the original view for stats
+
+    # Native async reads for ASGI deployments, same responses as their DRF counterparts
+    path('api/async/product/', async_product_list),
+    path('api/async/product/<int:pk>/', async_product_detail),
+    path('api/async/orders/', async_order_history),
+    path('api/async/discount-day/', async_discount_day_list),
 ]
 
 """generic foreing key in django for comments"""
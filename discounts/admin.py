@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import DiscountDay
+from .models import DiscountDay, SellerDailySales
 
-admin.site.register(DiscountDay)
\ No newline at end of file
+admin.site.register(DiscountDay)
+admin.site.register(SellerDailySales)
\ No newline at end of file
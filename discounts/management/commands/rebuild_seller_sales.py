@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from discounts.models import SellerDailySales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SellerDailySales rollup from the order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seller', help="Only rebuild the rows of this seller (username)")
+
+    def handle(self, *args, **options):
+        seller = None
+        if options['seller']:
+            try:
+                seller = User.objects.get(username=options['seller'])
+            except User.DoesNotExist:
+                raise CommandError(f"Seller {options['seller']} does not exist")
+
+        rows = SellerDailySales.rebuild(seller=seller)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily sales rows"))
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollup(apps, schema_editor):
+    """
+    Fill the rollup from existing order items, like SellerDailySales.rebuild.
+    The aggregates are spelled out here, discounts.models.sales_aggregates
+    may change after this migration.
+    """
+    from decimal import Decimal
+
+    from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+    from django.db.models.functions import Coalesce, TruncDate
+
+    OrderItem = apps.get_model('products', 'OrderItem')
+    SellerDailySales = apps.get_model('discounts', 'SellerDailySales')
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+    line_total = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=money)
+    line_discount = ExpressionWrapper(
+        F('quantity') * F('unit_price') * F('discount_percentage') / 100, output_field=money
+    )
+    daily_totals = (
+        OrderItem.objects.filter(product__user__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('product__user_id', 'day', 'is_discount_day')
+        .annotate(
+            total_items_sold=Count('pk'),
+            total_original_revenue=Coalesce(Sum(line_total), Value(Decimal('0')), output_field=money),
+            total_discount_amount=Coalesce(
+                Sum(line_discount, filter=Q(is_discount_day=True)), Value(Decimal('0')), output_field=money
+            ),
+        )
+        .order_by()
+    )
+    SellerDailySales.objects.bulk_create([
+        SellerDailySales(
+            seller_id=row['product__user_id'],
+            date=row['day'],
+            is_discount_day=row['is_discount_day'],
+            item_count=row['total_items_sold'],
+            gross_revenue=row['total_original_revenue'],
+            discount_given=row['total_discount_amount'],
+            net_revenue=row['total_original_revenue'] - row['total_discount_amount'],
+        )
+        for row in daily_totals.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0001_initial'),
+        ('products', '0003_orderitem_price_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('is_discount_day', models.BooleanField(default=False)),
+                ('item_count', models.IntegerField(default=0)),
+                ('gross_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('discount_given', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('seller', 'date', 'is_discount_day')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
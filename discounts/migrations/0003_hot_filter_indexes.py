@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0002_sellerdailysales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discountday',
+            index=models.Index(fields=['seller', 'date', 'is_active'], name='discountday_seller_active_idx'),
+        ),
+    ]
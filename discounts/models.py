@@ -1,5 +1,10 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
 from django.conf import settings
+from django.utils import timezone
 from clients.models import UserProfile
 
 class DiscountDay(models.Model):
@@ -18,3 +23,121 @@ class DiscountDay(models.Model):
     class Meta:
         unique_together = ('seller', 'date')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['seller', 'date', 'is_active'], name='discountday_seller_active_idx'),
+        ]
+
+
+CENTS = Decimal('0.01')
+
+
+def sales_aggregates():
+    """
+    Aggregate expressions over OrderItem rows: number of items, revenue before
+    discount and discount given, all computed by the database
+    """
+    money = DecimalField(max_digits=14, decimal_places=2)
+    line_total = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=money)
+    line_discount = ExpressionWrapper(
+        F('quantity') * F('unit_price') * F('discount_percentage') / 100, output_field=money
+    )
+    return {
+        'total_items_sold': Count('pk'),
+        'total_original_revenue': Coalesce(Sum(line_total), Value(Decimal('0')), output_field=money),
+        'total_discount_amount': Coalesce(
+            Sum(line_discount, filter=Q(is_discount_day=True)), Value(Decimal('0')), output_field=money
+        ),
+    }
+
+
+class SellerDailySales(models.Model):
+    """
+    Sales totals per seller and day, split by discount day. Kept up to date as
+    orders are placed and deleted so the stats endpoint never rescans order items.
+    Rebuild it from history with ``manage.py rebuild_seller_sales``.
+    """
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    is_discount_day = models.BooleanField(default=False)
+    item_count = models.IntegerField(default=0)
+    gross_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_given = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Sales of {self.seller_id} on {self.date}: {self.item_count} items, {self.net_revenue} net"
+
+    class Meta:
+        unique_together = ('seller', 'date', 'is_discount_day')
+        ordering = ['-date']
+
+    @classmethod
+    def record(cls, order_items, sign=1):
+        """
+        Add order items to the rollup, or take them out again with ``sign=-1``.
+        The items need their product loaded to know the seller.
+        """
+        totals = {}
+        for item in order_items:
+            seller_id = item.product.user_id
+            if seller_id is None:
+                continue
+            key = (seller_id, timezone.localdate(item.created_at), item.is_discount_day)
+            count, gross, discount = totals.get(key, (0, Decimal('0'), Decimal('0')))
+            totals[key] = (count + 1, gross + item.original_sub_total, discount + Decimal(item.discount_amount))
+
+        for (seller_id, date, is_discount_day), (count, gross, discount) in totals.items():
+            gross, discount = gross.quantize(CENTS), discount.quantize(CENTS)
+            rows = cls.objects.filter(seller_id=seller_id, date=date, is_discount_day=is_discount_day)
+            changes = {
+                'item_count': F('item_count') + sign * count,
+                'gross_revenue': F('gross_revenue') + sign * gross,
+                'discount_given': F('discount_given') + sign * discount,
+                'net_revenue': F('net_revenue') + sign * (gross - discount),
+            }
+            if rows.update(**changes) or sign < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        seller_id=seller_id, date=date, is_discount_day=is_discount_day,
+                        item_count=count, gross_revenue=gross, discount_given=discount,
+                        net_revenue=gross - discount,
+                    )
+            except IntegrityError:
+                # Another order created the row first
+                rows.update(**changes)
+
+    @classmethod
+    def rebuild(cls, seller=None):
+        """Recompute the rollup from every order item, for one seller or everybody"""
+        from products.models import OrderItem
+
+        order_items = OrderItem.objects.filter(product__user__isnull=False)
+        rollup = cls.objects.all()
+        if seller is not None:
+            order_items = order_items.filter(product__user=seller)
+            rollup = rollup.filter(seller=seller)
+
+        daily_totals = (
+            order_items.annotate(day=TruncDate('created_at'))
+            .values('product__user_id', 'day', 'is_discount_day')
+            .annotate(**sales_aggregates())
+            .order_by()
+        )
+        rows = [
+            cls(
+                seller_id=row['product__user_id'],
+                date=row['day'],
+                is_discount_day=row['is_discount_day'],
+                item_count=row['total_items_sold'],
+                gross_revenue=row['total_original_revenue'],
+                discount_given=row['total_discount_amount'],
+                net_revenue=row['total_original_revenue'] - row['total_discount_amount'],
+            )
+            for row in daily_totals.iterator()
+        ]
+        with transaction.atomic():
+            rollup.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
@@ -1,3 +1,109 @@
-from django.test import TestCase
+import datetime
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from products.models import Products, OrderItem
+from products.services import delete_order, place_order
+from .models import DiscountDay, SellerDailySales
+
+
+class SellerStatsTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.client.force_authenticate(self.seller)
+        self.product = Products.objects.create(name='Mango', price=Decimal('50.00'), stock=100, user=self.seller)
+        self.day = datetime.date(2025, 12, 25)
+        self.other_day = datetime.date(2025, 12, 26)
+        DiscountDay.objects.create(seller=self.seller, date=self.day, discount_percentage=Decimal('10.00'))
+        DiscountDay.objects.create(seller=self.seller, date=datetime.date(2025, 12, 31), discount_percentage=5)
+
+        self.sell(self.day, quantity=2, is_discount_day=True, discount_percentage=Decimal('10.00'))
+        self.sell(self.day, quantity=1, is_discount_day=True, discount_percentage=Decimal('10.00'))
+        self.sell(self.other_day, quantity=3)
+        SellerDailySales.rebuild()
+
+    def sell(self, day, **fields):
+        item = OrderItem.objects.create(product=self.product, **fields)
+        noon = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        OrderItem.objects.filter(pk=item.pk).update(created_at=noon)
+
+    def test_stats_for_a_discount_day(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/seller/stats/?type=discount&date=2025-12-25')
+        self.assertEqual(response.data['total_items_sold'], 2)
+        self.assertEqual(response.data['total_original_revenue'], Decimal('150.00'))
+        self.assertEqual(response.data['total_discount_amount'], Decimal('15.00'))
+        self.assertEqual(response.data['total_profit'], Decimal('135.00'))
+
+    def test_stats_for_all_discount_days(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/seller/stats/?type=discount')
+        stats = {row['date']: row for row in response.data['discount_day_stats']}
+        self.assertEqual(stats[self.day]['total_profit'], Decimal('135.00'))
+        self.assertEqual(stats[datetime.date(2025, 12, 31)]['total_items_sold'], 0)
+        self.assertEqual(response.data['summary']['total_discount_given'], Decimal('15.00'))
+
+    def test_stats_outside_discount_days(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/seller/stats/?type=non-discount&start_date=2025-12-01&end_date=2025-12-31'
+            )
+        self.assertEqual(response.data['stats'], {'total_items_sold': 1, 'total_profit': Decimal('150.00')})
+
+    def test_products_sold_on_discount_days(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/seller/stats/?type=discount&view=products')
+        [product] = response.data['products_sold_during_discount_days']
+        self.assertEqual(product['total_quantity_sold'], 3)
+        self.assertEqual(product['total_revenue'], 135.0)
+        self.assertEqual(product['discount_days']['2025-12-25']['discount_percentage'], 10.0)
+
+
+class SellerDailySalesTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.product = Products.objects.create(name='Mango', price=Decimal('12.50'), stock=100, user=self.seller)
+        DiscountDay.objects.create(seller=self.seller, date=timezone.localdate(), discount_percentage=20)
+
+    def snapshot(self):
+        return list(SellerDailySales.objects.values(
+            'seller', 'date', 'is_discount_day', 'item_count', 'gross_revenue', 'discount_given', 'net_revenue'
+        ))
+
+    def test_orders_update_the_rollup_incrementally(self):
+        place_order(self.customer, 'Cash on Delivery', [{'product_id': self.product.id, 'quantity': 3}])
+        order = place_order(self.customer, 'Cash on Delivery', [{'product_id': self.product.id, 'quantity': 1}])
+        [sales] = SellerDailySales.objects.all()
+        self.assertEqual(sales.item_count, 2)
+        self.assertEqual(sales.gross_revenue, Decimal('50.00'))
+        self.assertEqual(sales.discount_given, Decimal('10.00'))
+        self.assertEqual(sales.net_revenue, Decimal('40.00'))
+
+        incremental = self.snapshot()
+        SellerDailySales.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+        delete_order(order)
+        sales = SellerDailySales.objects.get()
+        self.assertEqual(sales.item_count, 1)
+        self.assertEqual(sales.net_revenue, Decimal('30.00'))
+
+
+class AsyncDiscountDayListTests(APITestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pass')
+        for day in range(3):
+            DiscountDay.objects.create(seller=seller, date=datetime.date(2025, 12, 20 + day), discount_percentage=10)
+
+    async def test_matches_the_sync_list_without_a_token(self):
+        response = await self.async_client.get('/api/async/discount-day/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([day['date'] for day in response.json()], ['2025-12-22', '2025-12-21', '2025-12-20'])
+        expected = await sync_to_async(self.client.get)('/api/discount-day/')
+        self.assertEqual(response.json(), json.loads(expected.content))
@@ -3,16 +3,31 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count
+from django.db.models import Max, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 from .serializers import DiscountDaySerializer, DiscountDayCreateSerializer
-from .models import DiscountDay
+from .models import DiscountDay, SellerDailySales, sales_aggregates
 from products.models import OrderItem
-from clients.models import UserProfile
+from clients.authentication import get_profile_info
+from core.asyncapi import async_api_view, json_response
+from core.routers import ReplicaReadMixin
 
 
-class DiscountDayView(APIView):
+def local_day_bounds(day):
+    """
+    [start, end) datetimes of a local calendar day. Filtering on these lets the
+    database use an index on created_at, where created_at__date wraps the column
+    in a function and forces a scan
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+class DiscountDayView(ReplicaReadMixin, APIView):
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
@@ -40,12 +55,11 @@ class DiscountDayView(APIView):
 
     def post(self, request):
         user = request.user
-        try:
-            user_profile = UserProfile.objects.get(user=user)
-            if user_profile.role != 'seller':
-                return Response({'error': 'Only sellers can create discount days'}, status=status.HTTP_403_FORBIDDEN)
-        except UserProfile.DoesNotExist:
+        user_profile = get_profile_info(user)
+        if user_profile is None:
             return Response({'error': 'User profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        if user_profile.role != 'seller':
+            return Response({'error': 'Only sellers can create discount days'}, status=status.HTTP_403_FORBIDDEN)
 
         data = request.data.copy()
         data['seller'] = user.id
@@ -101,7 +115,7 @@ class DiscountDayDetailView(APIView):
         return Response({'message': 'Discount day deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class SellerStatsView(APIView):
+class SellerStatsView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -125,10 +139,10 @@ class SellerStatsView(APIView):
         try:
             discount_day_date = datetime.strptime(date_str, '%Y-%m-%d').date()
             discount_day = DiscountDay.objects.get(seller=user, date=discount_day_date)
-            order_items = OrderItem.objects.filter(
-                product__user=user, created_at__date=discount_day_date, is_discount_day=True
-            )
-            stats = self._calculate_stats(order_items)
+            daily_sales = SellerDailySales.objects.filter(
+                seller=user, date=discount_day_date, is_discount_day=True
+            ).first()
+            stats = self._daily_sales_stats(daily_sales)
 
             return Response({
                 'discount_day_id': discount_day.id,
@@ -141,12 +155,14 @@ class SellerStatsView(APIView):
 
     def _get_all_discount_day_stats(self, user):
         discount_days = DiscountDay.objects.filter(seller=user)
+        daily_sales = SellerDailySales.objects.filter(
+            seller=user, is_discount_day=True, date__in=discount_days.values('date')
+        )
+        sales_by_day = {sales.date: sales for sales in daily_sales}
+
         stats_list = []
         for discount_day in discount_days:
-            order_items = OrderItem.objects.filter(
-                product__user=user, created_at__date=discount_day.date, is_discount_day=True
-            )
-            stats = self._calculate_stats(order_items)
+            stats = self._daily_sales_stats(sales_by_day.get(discount_day.date))
             stats['discount_day_id'] = discount_day.id
             stats['date'] = discount_day.date
             stats['discount_percentage'] = discount_day.discount_percentage
@@ -169,108 +185,99 @@ class SellerStatsView(APIView):
         if start_date_str and end_date_str:
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            discount_days = DiscountDay.objects.filter(
-                seller=user, date__range=[start_date, end_date], is_active=True
-            ).values_list('date', flat=True)
-            order_items = OrderItem.objects.filter(
-                product__user=user, created_at__date__range=[start_date, end_date]
-            ).exclude(created_at__date__in=list(discount_days), is_discount_day=True)
         else:
             # Default to current month if no dates provided
-            current_month_start = timezone.now().replace(day=1).date()
-            next_month = current_month_start.replace(day=28) + timezone.timedelta(days=4)
-            current_month_end = next_month - timezone.timedelta(days=next_month.day)
-            discount_days = DiscountDay.objects.filter(
-                seller=user, date__month=timezone.now().month, date__year=timezone.now().year, is_active=True
-            ).values_list('date', flat=True)
-            order_items = OrderItem.objects.filter(
-                product__user=user, created_at__month=timezone.now().month, created_at__year=timezone.now().year
-            ).exclude(created_at__date__in=list(discount_days), is_discount_day=True)
-
-        total_items = order_items.aggregate(total=Count('*'))['total'] or 0
-        total_profit = sum(item.sub_total for item in order_items)
+            start_date = timezone.localdate().replace(day=1)
+            next_month = start_date.replace(day=28) + timezone.timedelta(days=4)
+            end_date = next_month - timezone.timedelta(days=next_month.day)
+
+        discount_days = DiscountDay.objects.filter(
+            seller=user, date__range=[start_date, end_date], is_active=True
+        ).values('date')
+        totals = SellerDailySales.objects.filter(
+            seller=user, date__range=[start_date, end_date]
+        ).exclude(date__in=discount_days, is_discount_day=True).aggregate(
+            total_items_sold=Coalesce(Sum('item_count'), 0),
+            total_profit=Coalesce(Sum('gross_revenue'), Value(Decimal('0'))),
+        )
 
         return Response({
             'stats_type': 'non_discount_days',
-            'stats': {
-                'total_items_sold': total_items,
-                'total_profit': total_profit
-            }
+            'stats': totals
         })
 
-    def _calculate_stats(self, order_items):
-        """Helper method to calculate stats from order items"""
-        total_items = order_items.aggregate(total=Count('*'))['total'] or 0
-        total_profit = sum(item.final_sub_total for item in order_items)
-        total_original = sum(item.original_sub_total for item in order_items)
-        total_discount = sum(item.discount_amount for item in order_items)
+    def _daily_sales_stats(self, daily_sales):
+        """Stats for one day read from the SellerDailySales rollup row, if there were sales"""
+        if daily_sales is None:
+            return self._finish_stats({})
+        return {
+            'total_items_sold': daily_sales.item_count,
+            'total_profit': daily_sales.net_revenue,
+            'total_original_revenue': daily_sales.gross_revenue,
+            'total_discount_amount': daily_sales.discount_given
+        }
 
+    def _stats_aggregates(self):
+        """Aggregate expressions shared by the stats computed from order items"""
+        return sales_aggregates()
+
+    def _finish_stats(self, totals):
+        total_original = totals.get('total_original_revenue', Decimal('0'))
+        total_discount = totals.get('total_discount_amount', Decimal('0'))
         return {
-            'total_items_sold': total_items,
-            'total_profit': total_profit,
+            'total_items_sold': totals.get('total_items_sold', 0),
+            'total_profit': total_original - total_discount,
             'total_original_revenue': total_original,
             'total_discount_amount': total_discount
         }
 
     def _get_products_sold_on_discount_days(self, user, date_str=None):
         """Get detailed information about products sold during discount days"""
-        from products.models import OrderItem
+        order_items = OrderItem.objects.filter(product__user=user, is_discount_day=True)
         if date_str:
             # Get products sold on a specific discount day
             try:
                 target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                discount_day = DiscountDay.objects.get(seller=user, date=target_date)
-                order_items = OrderItem.objects.filter(
-                    product__user=user,
-                    created_at__date=target_date,
-                    is_discount_day=True
-                ).select_related('product')
+                DiscountDay.objects.get(seller=user, date=target_date)
+                day_start, day_end = local_day_bounds(target_date)
+                order_items = order_items.filter(created_at__gte=day_start, created_at__lt=day_end)
             except DiscountDay.DoesNotExist:
                 return Response({'error': 'Discount day not found'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            # Get products sold on all discount days for this seller
-            discount_days = DiscountDay.objects.filter(seller=user)
-            order_items = OrderItem.objects.filter(
-                product__user=user,
-                is_discount_day=True
-            ).select_related('product')
-
-        # Group items by product and discount day
-        products_sold = {}
-        for item in order_items:
-            product_id = item.product.id
-            product_name = item.product.name
-            product_date = item.created_at.date()
 
+        # Group items by product and discount day in the database
+        aggregates = self._stats_aggregates()
+        rows = (
+            order_items.annotate(day=TruncDate('created_at'))
+            .values('product_id', 'product__name', 'product__price', 'day')
+            .annotate(
+                quantity_sold=Sum('quantity'),
+                revenue=aggregates['total_original_revenue'],
+                discount=aggregates['total_discount_amount'],
+                discount_percentage=Max('discount_percentage'),
+            )
+            .order_by('product_id', 'day')
+        )
+
+        products_sold = {}
+        for row in rows:
+            product_id = row['product_id']
             if product_id not in products_sold:
                 products_sold[product_id] = {
-                    'product_name': product_name,
-                    'product_price': float(item.product.price),
+                    'product_name': row['product__name'],
+                    'product_price': float(row['product__price']),
                     'discount_days': {},
                     'total_quantity_sold': 0,
                     'total_revenue': 0
                 }
 
-            if product_date not in products_sold[product_id]['discount_days']:
-                products_sold[product_id]['discount_days'][str(product_date)] = {
-                    'quantity': 0,
-                    'revenue': 0,
-                    'discount_percentage': 0
-                }
-
-            # Get discount percentage for this day
-            try:
-                discount_day = DiscountDay.objects.get(seller=user, date=product_date)
-                discount_percentage = discount_day.discount_percentage
-            except DiscountDay.DoesNotExist:
-                discount_percentage = 0
-
-            products_sold[product_id]['discount_days'][str(product_date)]['quantity'] += item.quantity
-            products_sold[product_id]['discount_days'][str(product_date)]['revenue'] += float(item.final_sub_total)
-            products_sold[product_id]['discount_days'][str(product_date)]['discount_percentage'] = float(discount_percentage)
-
-            products_sold[product_id]['total_quantity_sold'] += item.quantity
-            products_sold[product_id]['total_revenue'] += float(item.final_sub_total)
+            revenue = float(row['revenue'] - row['discount'])
+            products_sold[product_id]['discount_days'][str(row['day'])] = {
+                'quantity': row['quantity_sold'],
+                'revenue': revenue,
+                'discount_percentage': float(row['discount_percentage'])
+            }
+            products_sold[product_id]['total_quantity_sold'] += row['quantity_sold']
+            products_sold[product_id]['total_revenue'] += revenue
 
         return Response({
             'products_sold_during_discount_days': list(products_sold.values()),
@@ -301,3 +308,11 @@ class SellerStatsView(APIView):
             return self._get_non_discount_day_stats(user, start_date_str, end_date_str)
         else:
             return Response({'error': 'Invalid type. Use "discount" or "non-discount".'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@async_api_view(authenticated=False, replica=True)
+async def async_discount_day_list(request):
+    """GET /api/async/discount-day/, every discount day like DiscountDayView, native async for ASGI"""
+    serializer = DiscountDaySerializer()
+    days = DiscountDay.objects.order_by('-date').aiterator(chunk_size=500)
+    return json_response([serializer.to_representation(day) async for day in days])
@@ -1,8 +1,26 @@
 from django.contrib import admin
 from .models import *
 
-admin.site.register(Products)
+
+@admin.register(Products)
+class ProductsAdmin(admin.ModelAdmin):
+    list_display = ('name', 'price', 'stock', 'status', 'user', 'deleted_at')
+    list_filter = ('status',)
+    actions = ('soft_delete', 'restore')
+
+    def get_queryset(self, request):
+        # Admins also see and restore soft deleted products
+        return Products.all_objects.all()
+
+    @admin.action(description="Soft delete the selected products")
+    def soft_delete(self, request, queryset):
+        queryset.soft_delete()
+
+    @admin.action(description="Restore the selected products")
+    def restore(self, request, queryset):
+        queryset.restore()
+
+
 admin.site.register(OrderItem)
 admin.site.register(Order)
 # Register your models here.
-
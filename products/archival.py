@@ -0,0 +1,210 @@
+"""
+Archival of rows the API no longer serves.
+
+Orders older than ARCHIVE_ORDER_DAYS, cancelled ones after
+ARCHIVE_CANCELLED_ORDER_DAYS, are written with their items to gzipped
+NDJSON and deleted. Then soft deleted products older than
+ARCHIVE_PRODUCT_DAYS follow, once no order item refers to them anymore.
+The sellers' daily sales rollup keeps the archived orders, so seller stats
+do not change; their SellerOrder links go with them.
+
+Work happens in batches of a few hundred rows, each deleted in its own
+short transaction, so a live database is never locked for long. Before a
+batch is appended to the archive as its own gzip member, its keys and the
+archive's size are written to a checkpoint file. A run that died before the
+rows were deleted cuts the archive back to that size and does the batch
+again, so nothing is archived twice or lost.
+
+Runs lock a file in the archive directory: runs sharing ARCHIVE_DIR never
+overlap, a run that dies releases the lock with its process.
+"""
+import contextlib
+import datetime
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Order, OrderItem, Products
+
+CHECKPOINT_FILE = 'checkpoint.json'
+LOCK_FILE = 'archive.lock'
+
+
+class ArchivalError(Exception):
+    """Another archival run holds the lock"""
+
+
+@contextlib.contextmanager
+def _lock(directory):
+    path = directory / LOCK_FILE
+    if fcntl is None:
+        # No flock, the lock file itself is the lock. Delete it by hand after a crash
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise ArchivalError(f"Another archival run is in progress, or remove {path}")
+        try:
+            yield
+        finally:
+            path.unlink()
+        return
+
+    with open(path, 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ArchivalError("Another archival run is in progress")
+        yield
+
+
+def archive(directory=None, batch_size=500, max_batches=None, pause=0.0, now=None,
+            order_days=None, cancelled_days=None, product_days=None, progress=None):
+    """
+    Archive and delete old orders, then purge old soft deleted products.
+    ``pause`` seconds are slept between batches to leave the database to
+    other writers, ``progress(kind, totals)`` is called after every batch.
+    Returns a Counter of the deleted 'orders', 'order_items' and 'products'.
+    """
+    directory = Path(directory or settings.ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = now or timezone.now()
+    selections = (
+        ('orders', _old_orders(
+            _cutoff(now, order_days, settings.ARCHIVE_ORDER_DAYS),
+            _cutoff(now, cancelled_days, settings.ARCHIVE_CANCELLED_ORDER_DAYS),
+        )),
+        ('products', _purgeable_products(_cutoff(now, product_days, settings.ARCHIVE_PRODUCT_DAYS))),
+    )
+
+    with _lock(directory):
+        totals = Counter()
+        _resume(directory, selections, totals)
+        batches = 0
+        for kind, rows in selections:
+            path = directory / f'{kind}-{now:%Y%m%d}.ndjson.gz'
+            while max_batches is None or batches < max_batches:
+                pks = list(rows.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                _archive_batch(directory, path, kind, rows, pks, totals)
+                batches += 1
+                if progress is not None:
+                    progress(kind, totals)
+                if pause:
+                    time.sleep(pause)
+        return totals
+
+
+def _cutoff(now, days, default):
+    return now - datetime.timedelta(days=default if days is None else days)
+
+
+def _old_orders(cutoff, cancelled_cutoff):
+    # No ORDER BY: old rows sit at the start of the table, the scan stops after a batch
+    return Order.objects.filter(
+        Q(created_at__lt=cutoff) | Q(status=Order.StatusofProduct.CANCELLED, created_at__lt=cancelled_cutoff)
+    ).order_by()
+
+
+def _purgeable_products(cutoff):
+    # Products with order items stay until those orders are archived, deleting them would cascade
+    return Products.all_objects.filter(deleted_at__lt=cutoff).filter(
+        ~Exists(OrderItem.objects.filter(product=OuterRef('pk')))
+    ).order_by()
+
+
+def _records(kind, pks):
+    """The archived form of a batch: one dict per row, orders carry their items"""
+    if kind == 'products':
+        rows = Products.all_objects.filter(pk__in=pks).values()
+        return [{'model': 'products.products', **row} for row in rows], []
+
+    links = list(Order.order_item.through.objects.filter(order_id__in=pks).values_list('order_id', 'orderitem_id'))
+    items = {row['number']: row for row in OrderItem.objects.filter(pk__in=[item for _, item in links]).values()}
+    by_order = {}
+    for order_id, item_id in links:
+        if item_id in items:
+            by_order.setdefault(order_id, []).append(items[item_id])
+    records = [
+        {'model': 'products.order', **row, 'items': by_order.get(row['number'], [])}
+        for row in Order.objects.filter(pk__in=pks).values()
+    ]
+    return records, list(items)
+
+
+def _append(path, records):
+    """Add the records as one more gzip member and make sure they are on disk"""
+    lines = ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in records)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive_file:
+            archive_file.write(lines.encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _save_checkpoint(directory, pending):
+    path = directory / CHECKPOINT_FILE
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps({'pending': pending}, cls=DjangoJSONEncoder))
+    os.replace(temporary, path)
+
+
+def _archive_batch(directory, path, kind, rows, pks, totals):
+    records, item_pks = _records(kind, pks)
+    size = path.stat().st_size if path.exists() else 0
+    _save_checkpoint(directory, {'kind': kind, 'pks': pks, 'items': item_pks, 'file': path.name, 'size': size})
+    _append(path, records)
+    _delete(kind, rows, pks, item_pks, totals)
+    _save_checkpoint(directory, None)
+
+
+def _delete(kind, rows, pks, item_pks, totals):
+    with transaction.atomic():
+        if kind == 'orders':
+            # Straight deletes: delete_order() would also take the orders out of the sales rollup
+            deleted = OrderItem.objects.filter(pk__in=item_pks).delete()[1]
+            totals['order_items'] += deleted.get(OrderItem._meta.label, 0)
+            totals['orders'] += rows.filter(pk__in=pks).delete()[1].get(Order._meta.label, 0)
+        else:
+            # Still matching: a product restored since it was archived stays
+            totals['products'] += rows.filter(pk__in=pks).delete()[1].get(Products._meta.label, 0)
+
+
+def _truncate(path, size):
+    if not path.exists():
+        return
+    with open(path, 'r+b') as archive_file:
+        archive_file.truncate(size)
+        os.fsync(archive_file.fileno())
+
+
+def _resume(directory, selections, totals):
+    """Redo a batch whose rows a run that died did not get to delete"""
+    path = directory / CHECKPOINT_FILE
+    if not path.exists():
+        return
+    pending = json.loads(path.read_text())['pending']
+    if pending:
+        model = Order if pending['kind'] == 'orders' else Products
+        # The delete is one transaction: with any row left it did not happen
+        if model._base_manager.filter(pk__in=pending['pks']).exists():
+            archive_path = directory / pending['file']
+            # Drop what of the batch reached the archive, all of it or a torn gzip member
+            _truncate(archive_path, pending['size'])
+            rows = dict(selections)[pending['kind']]
+            _archive_batch(directory, archive_path, pending['kind'], rows, pending['pks'], totals)
+    _save_checkpoint(directory, None)
@@ -0,0 +1,196 @@
+"""
+Bulk product import and export for sellers.
+
+Imports read CSV or NDJSON rows one at a time, normalize and validate them
+like products created through the API and write them chunk by chunk with
+bulk_create / bulk_update, so a 20k row file costs a few hundred queries
+instead of one request per product. A row with an ``id`` updates that
+product, a row without one updates the seller's live product of the same
+name or creates a new product.
+
+Chunks are committed as they go. A line that cannot be read at all (not
+UTF-8, broken CSV quoting) ends the import there: the rows before it stay
+imported and the result names the line.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Products
+from .serializers import ProductSerializer, sanitize_product_text
+
+FORMATS = ('csv', 'ndjson')
+EXPORT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'status')
+UPDATE_FIELDS = ('name', 'description', 'price', 'stock', 'status')
+TEXT_FIELDS = ('name', 'description')
+
+
+class BulkImportError(Exception):
+    """The file itself cannot be read, individual bad rows are reported instead"""
+
+
+def format_from_name(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def read_rows(stream, file_format):
+    """
+    Yield (line, row) from a binary or text stream. Lines that are not valid
+    JSON objects come out as (line, None).
+    """
+    if file_format not in FORMATS:
+        raise BulkImportError(f"Unsupported format {file_format}, use csv or ndjson")
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None or 'name' not in reader.fieldnames:
+            raise BulkImportError("The CSV header must contain at least a name column")
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield line, row if isinstance(row, dict) else None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_id(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({'id': ['A valid integer is required.']})
+
+
+def _readable(rows, result):
+    """Pass the rows on until one cannot be read, then note where the import stopped"""
+    line = 0
+    try:
+        for line, row in rows:
+            yield line, row
+    except (UnicodeDecodeError, csv.Error) as e:
+        message = 'The file must be UTF-8 encoded' if isinstance(e, UnicodeDecodeError) else str(e)
+        result['stopped_at_line'] = line + 1
+        result['errors'].append({'line': line + 1, 'errors': {'non_field_errors': [message]}})
+
+
+def _normalize(row):
+    return {
+        key: sanitize_product_text(value) if key in TEXT_FIELDS and isinstance(value, str) else value
+        for key, value in row.items() if key != 'id'
+    }
+
+
+def import_products(seller, rows, chunk_size=1000):
+    """
+    Upsert the seller's products from (line, row) pairs as produced by
+    read_rows. Returns {'created', 'updated', 'errors', 'stopped_at_line'},
+    every error names the line it came from. Each chunk is written in its
+    own transaction. When the rest of the file cannot be read,
+    ``stopped_at_line`` is the first line that was not imported, otherwise
+    it is None.
+    """
+    validator = ProductSerializer()
+    result = {'created': 0, 'updated': 0, 'errors': [], 'stopped_at_line': None}
+
+    for chunk in _chunks(_readable(rows, result), chunk_size):
+        valid = []
+        for line, row in chunk:
+            if row is None:
+                result['errors'].append({'line': line, 'errors': {'non_field_errors': ['Invalid JSON object']}})
+                continue
+            try:
+                pk = _parse_id(row.get('id'))
+                data = validator.run_validation(_normalize(row))
+            except serializers.ValidationError as e:
+                result['errors'].append({'line': line, 'errors': e.detail})
+                continue
+            if data['stock'] > 0:
+                data['status'] = Products.StatusofProduct.AVAILABLE
+            else:
+                data['status'] = Products.StatusofProduct.OUT_OF_STOCK
+            valid.append((line, pk, data))
+
+        created, updated = _write_chunk(seller, valid, result['errors'])
+        result['created'] += created
+        result['updated'] += updated
+
+    return result
+
+
+def _write_chunk(seller, rows, errors):
+    ids = {pk for _, pk, _ in rows if pk is not None}
+    names = {data['name'] for _, pk, data in rows if pk is None}
+    by_id = Products.objects.filter(user=seller, pk__in=ids).in_bulk()
+    by_name = {}
+    for product in Products.objects.filter(user=seller, name__in=names).order_by('-id'):
+        by_name.setdefault(product.name, product)
+
+    to_create, to_update = {}, {}
+    for line, pk, data in rows:
+        if pk is not None:
+            product = by_id.get(pk)
+            if product is None:
+                errors.append({'line': line, 'errors': {'id': [f'Product {pk} not found']}})
+                continue
+        else:
+            product = by_name.get(data['name']) or to_create.get(data['name'])
+        if product is None:
+            to_create[data['name']] = Products(user=seller, **data)
+            continue
+        for field, value in data.items():
+            setattr(product, field, value)
+        if product.pk is not None:
+            to_update[product.pk] = product
+
+    with transaction.atomic():
+        Products.objects.bulk_create(to_create.values())
+        Products.objects.bulk_update(to_update.values(), UPDATE_FIELDS)
+    return len(to_create), len(to_update)
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each line back instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(products, file_format, chunk_size=2000):
+    """Yield the products as CSV or NDJSON lines, reading them chunk_size rows at a time"""
+    rows = products.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + '\n'
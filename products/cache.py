@@ -0,0 +1,111 @@
+"""
+Response cache for the product catalog and product detail endpoints.
+
+Cached entries are keyed by version tokens instead of being deleted: the
+catalog has one version, every product has its own and all product details
+share one generation. Changing a product replaces its token and the catalog
+token, queryset updates of several products replace the generation instead
+of one token per row. Every entry built from the old data simply stops being
+looked up and expires on its own.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.routers import reading_from_replica
+
+CATALOG_VERSION_KEY = 'products:catalog:version'
+GENERATION_KEY = 'products:generation'
+
+
+def product_version_key(pk):
+    return f'products:product:{pk}:version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have set it in between, use theirs
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump(keys):
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+
+def invalidate_products(pks=None, using=None):
+    """
+    Bump the catalog version and the version of the changed products: of
+    the single product in ``pks``, of every product when ``pks`` is None or
+    holds several, of none when it is empty (new products). Inside a
+    transaction this waits for the commit, a request running before it
+    would cache the old rows under the new version otherwise.
+    """
+    keys = [CATALOG_VERSION_KEY]
+    if pks is None:
+        keys.append(GENERATION_KEY)
+    else:
+        pks = list(pks)
+        if len(pks) == 1:
+            keys.append(product_version_key(pks[0]))
+        elif pks:
+            keys.append(GENERATION_KEY)
+    transaction.on_commit(lambda: _bump(keys), using=using)
+
+
+def _request_digest(request):
+    # The body depends on the renderer and on absolute URLs (the next cursor)
+    fingerprint = f'{request.accepted_renderer.format}:{request.build_absolute_uri()}'
+    return hashlib.md5(fingerprint.encode()).hexdigest()
+
+
+def catalog_key(request):
+    return f'products:catalog:{get_version(CATALOG_VERSION_KEY)}:{_request_digest(request)}'
+
+
+def product_key(request, pk):
+    version = f'{get_version(GENERATION_KEY)}:{get_version(product_version_key(pk))}'
+    return f'products:product:{pk}:{version}:{_request_digest(request)}'
+
+
+def cached_response(request, key, build):
+    """
+    Return the cached body stored under ``key``, calling ``build`` for a
+    Response on a miss. Only 200 responses are cached. The ETag is a hash of
+    the body, a matching If-None-Match gets an empty 304. Bodies read from a
+    replica are only kept for REPLICA_STICKY_SECONDS. With
+    PRODUCT_CACHE_TIMEOUT = 0 every request is built from the database.
+    """
+    if not settings.PRODUCT_CACHE_TIMEOUT:
+        return build()
+
+    entry = cache.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True)
+        etag = '"%s"' % hashlib.md5(f'{request.accepted_renderer.format}:{body}'.encode()).hexdigest()
+        entry = (etag, response.data)
+        timeout = settings.PRODUCT_CACHE_TIMEOUT
+        if reading_from_replica():
+            # A lagging replica can still return rows older than the version in the key
+            timeout = min(timeout, settings.REPLICA_STICKY_SECONDS)
+        cache.set(key, entry, timeout)
+
+    etag, data = entry
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
@@ -0,0 +1,151 @@
+"""
+Facet counts of the live catalog: products per status, seller, price range
+and month created.
+
+The counts live in ProductFacetCount and are adjusted as products change:
+saves and deletes through their signals, queryset updates and bulk_create
+through ProductQuerySet. Each write works out which facet values the
+products left and joined, so the catalog is never recounted on the request
+path: saves compare the instance with its loaded state, queryset updates
+group the rows they change by their value before and after the update,
+only in the dimensions they can change.
+ProductFacetCount.rebuild() recounts from scratch.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, F, Model, Q, Value, When
+from django.db.models.functions import TruncMonth
+
+# Columns the facet values are computed from
+FIELDS = ('status', 'user_id', 'price', 'created_at', 'deleted_at')
+DIMENSIONS = ('status', 'seller', 'price', 'created')
+# Dimensions a QuerySet.update() keyword can move products between, deleted_at adds or removes them
+UPDATE_DIMENSIONS = {
+    'status': ('status',),
+    'user': ('seller',),
+    'user_id': ('seller',),
+    'price': ('price',),
+    'created_at': ('created',),
+    'deleted_at': DIMENSIONS,
+}
+
+# Lower bound inclusive, upper bound exclusive, None for open ended
+PRICE_RANGES = ((0, 100), (100, 500), (500, 1000), (1000, None))
+
+
+def price_range(price):
+    price = Decimal(str(price))
+    for low, high in PRICE_RANGES:
+        if high is None or price < high:
+            return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def state_of(product):
+    """The facet columns of a product instance"""
+    return {field: getattr(product, field) for field in FIELDS}
+
+
+def facet_values(state):
+    """(dimension, value) pairs a product with this state is counted under, none when deleted"""
+    if state is None or state['deleted_at'] is not None:
+        return []
+    values = [('status', state['status']), ('price', price_range(state['price']))]
+    if state['user_id'] is not None:
+        values.append(('seller', str(state['user_id'])))
+    if state['created_at'] is not None:
+        values.append(('created', state['created_at'].strftime('%Y-%m')))
+    return values
+
+
+def changes(old, new):
+    """Counter of (dimension, value) -> delta for a product going from state old to new (None: absent)"""
+    delta = Counter()
+    for key in facet_values(old):
+        delta[key] -= 1
+    for key in facet_values(new):
+        delta[key] += 1
+    return Counter({key: count for key, count in delta.items() if count})
+
+
+def updated_dimensions(kwargs):
+    """The dimensions a QuerySet.update(**kwargs) may change"""
+    return {dimension for keyword in kwargs for dimension in UPDATE_DIMENSIONS.get(keyword, ())}
+
+
+def _value(dimension, columns):
+    """Expression of the facet value in ``dimension``, from the facet columns named in ``columns``"""
+    if dimension == 'status':
+        return F(columns['status'])
+    if dimension == 'seller':
+        return F(columns['user_id'])
+    if dimension == 'price':
+        return Case(
+            *[
+                When(**{f"{columns['price']}__lt": high}, then=Value(price_range(low)))
+                for low, high in PRICE_RANGES if high is not None
+            ],
+            default=Value(price_range(PRICE_RANGES[-1][0])),
+        )
+    return TruncMonth(columns['created_at'])
+
+
+def _label(dimension, value):
+    if dimension == 'seller':
+        return str(value)
+    if dimension == 'created':
+        return value.strftime('%Y-%m')
+    return value
+
+
+def count(products, dimensions=DIMENSIONS):
+    """
+    Counter of (dimension, value) -> live products, counted with one GROUP
+    BY per dimension. Rebuilds the stored counts.
+    """
+    products = products.filter(deleted_at__isnull=True).order_by()
+    columns = {field: field for field in FIELDS}
+    counts = Counter()
+    for dimension in dimensions:
+        for value, total in products.values_list(_value(dimension, columns)).annotate(total=Count('id')):
+            if value is not None:
+                counts[(dimension, _label(dimension, value))] += total
+    return counts
+
+
+def update_changes(products, dimensions, kwargs):
+    """
+    Counter of the changes a QuerySet.update(**kwargs) of products makes,
+    with one GROUP BY per dimension before it runs. SET expressions see the
+    rows as they are, so the same expressions annotated on the products give
+    the values the update leaves behind; the rows are grouped by their value
+    and liveness before and after.
+    """
+    old_columns = {field: field for field in FIELDS}
+    columns = dict(old_columns)
+    for keyword, value in kwargs.items():
+        field = products.model._meta.get_field(keyword)
+        if field.attname not in FIELDS:
+            continue
+        if isinstance(value, Model):
+            value = value.pk
+        if not hasattr(value, 'resolve_expression'):
+            value = Value(value, output_field=field.target_field if field.is_relation else field)
+        columns[field.attname] = f'updated_{field.attname}'
+        products = products.annotate(**{columns[field.attname]: value})
+
+    def live(column):
+        return ExpressionWrapper(Q(**{f'{column}__isnull': True}), output_field=BooleanField())
+
+    products = products.annotate(was_live=live('deleted_at'), is_live=live(columns['deleted_at'])).order_by()
+    delta = Counter()
+    for dimension in dimensions:
+        rows = products.values_list(
+            _value(dimension, old_columns), 'was_live', _value(dimension, columns), 'is_live'
+        ).annotate(total=Count('id'))
+        for before, was_live, after, is_live, total in rows:
+            if was_live and before is not None:
+                delta[(dimension, _label(dimension, before))] -= total
+            if is_live and after is not None:
+                delta[(dimension, _label(dimension, after))] += total
+    return Counter({key: change for key, change in delta.items() if change})
@@ -0,0 +1,147 @@
+"""
+Resized WebP / JPEG variants of product images.
+
+Saving a product with a new image schedules generate_variants() on a small
+thread pool once the transaction commits, so uploads return right away.
+The job decodes the original in draft mode (JPEGs are decoded at a reduced
+scale, never at full size), drops EXIF/ICC metadata and writes one file per
+variant and format next to the original. Paths are stored in
+Products.image_variants together with the source image they were made from.
+
+Other formats cannot be decoded at a smaller scale. Whatever the format, the
+size it would be decoded at is read from the header first, and images of
+more than PRODUCT_IMAGE_MAX_PIXELS get no variants. This keeps the memory
+each worker needs bounded.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: bounding box, largest first so each variant is resized from the previous one
+VARIANTS = {
+    'medium': (800, 800),
+    'thumb': (200, 200),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+class ImageTooLarge(ValueError):
+    """The image would be decoded at more than PRODUCT_IMAGE_MAX_PIXELS"""
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images'
+        )
+    return _executor
+
+
+def variants_outdated(product):
+    """True when the stored variants were not made from the current image"""
+    source = product.image.name if product.image else None
+    return (product.image_variants or {}).get('source') != source
+
+
+def schedule_variants(product_id):
+    """Run generate_variants after commit, in the pool or inline when PRODUCT_IMAGE_WORKERS is 0"""
+    if settings.PRODUCT_IMAGE_WORKERS > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, product_id))
+    else:
+        transaction.on_commit(lambda: generate_variants(product_id))
+
+
+def _run_in_thread(product_id):
+    try:
+        generate_variants(product_id)
+    except Exception:
+        logger.exception("Could not build image variants of product %s", product_id)
+    finally:
+        # Worker threads get their own connections, do not leave them open
+        connections.close_all()
+
+
+def variant_path(product_id, name, extension):
+    return f'products/variants/{product_id}/{name}.{extension}'
+
+
+def render_variants(source):
+    """Yield (name, extension, bytes) for every variant of the image in the open file ``source``"""
+    with Image.open(source) as image:
+        largest = max(VARIANTS.values())
+        # JPEG only: lets the decoder scale by 1/2..1/8 while reading
+        image.draft('RGB', largest)
+        # Nothing is decoded yet, the size is the one the pixels will be decoded at
+        if image.width * image.height > settings.PRODUCT_IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f"{image.format} image of {image.width}x{image.height} pixels")
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        for name, size in VARIANTS.items():
+            image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            # Encoders copy nothing from info when it is empty: no EXIF, GPS or ICC data
+            image.info = {}
+            for extension, (image_format, options) in FORMATS.items():
+                output = io.BytesIO()
+                image.save(output, image_format, **options)
+                yield name, extension, output.getvalue()
+
+
+def generate_variants(product_id):
+    """Build the variants of a product's current image, or remove them when it has none"""
+    from .models import Products
+
+    product = Products.objects.filter(pk=product_id).only('id', 'image', 'image_variants').first()
+    if product is None or not variants_outdated(product):
+        return
+
+    for paths in (product.image_variants or {}).values():
+        if isinstance(paths, dict):
+            for path in paths.values():
+                default_storage.delete(path)
+
+    variants = {'source': product.image.name if product.image else None}
+    if product.image:
+        try:
+            with default_storage.open(product.image.name, 'rb') as source:
+                for name, extension, content in render_variants(source):
+                    path = variant_path(product_id, name, extension)
+                    default_storage.delete(path)
+                    variants.setdefault(name, {})[extension] = default_storage.save(path, ContentFile(content))
+        except ImageTooLarge as e:
+            # Recorded without variants, so it is not tried again; clients fall back to the original
+            logger.warning("No image variants for product %s: %s", product_id, e)
+            variants = {'source': product.image.name}
+
+    # Skipped when the image was replaced meanwhile, that save scheduled another run
+    rows = Products.objects.filter(pk=product_id)
+    if product.image:
+        rows = rows.filter(image=product.image.name)
+    else:
+        rows = rows.filter(Q(image='') | Q(image__isnull=True))
+    rows.update(image_variants=variants)
+
+
+def variant_urls(product):
+    """{'medium': {'webp': url, 'jpeg': url}, 'thumb': {...}} for the serializers"""
+    return {
+        name: {extension: default_storage.url(path) for extension, path in paths.items()}
+        for name, paths in (product.image_variants or {}).items()
+        if isinstance(paths, dict)
+    }
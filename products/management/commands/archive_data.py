@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import archival
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old orders and long soft deleted products out of the live tables into gzipped NDJSON "
+        "archives, in small batches (safe to run from cron against a live database)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Where the archives go, ARCHIVE_DIR by default")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches, the next run continues")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches")
+        parser.add_argument('--order-days', type=int, help="Defaults to ARCHIVE_ORDER_DAYS")
+        parser.add_argument('--cancelled-days', type=int, help="Defaults to ARCHIVE_CANCELLED_ORDER_DAYS")
+        parser.add_argument('--product-days', type=int, help="Defaults to ARCHIVE_PRODUCT_DAYS")
+
+    def handle(self, *args, **options):
+        def progress(kind, totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"{kind}: {totals['orders']} orders, {totals['order_items']} items, "
+                    f"{totals['products']} products so far"
+                )
+
+        try:
+            totals = archival.archive(
+                directory=options['directory'],
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches'],
+                pause=options['pause'],
+                order_days=options['order_days'],
+                cancelled_days=options['cancelled_days'],
+                product_days=options['product_days'],
+                progress=progress,
+            )
+        except (OSError, archival.ArchivalError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['orders']} orders with {totals['order_items']} items "
+            f"and {totals['products']} products"
+        ))
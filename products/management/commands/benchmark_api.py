@@ -0,0 +1,125 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from clients.models import ShoppingList
+from clients.views import get_tokens_for_user
+from core.benchmarking import measure, throwaway_database
+from products.models import Products, Order
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'core' / 'benchmark_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and report latency, query counts and peak memory of the public API. "
+        "Fails when an endpoint runs more queries than the recorded baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true', help="Write the measured query counts as the new baseline")
+        parser.add_argument('--existing', action='store_true', help="Use the configured database, already seeded with seed_data")
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        if options['existing']:
+            results = self.run(options)
+        else:
+            with throwaway_database():
+                call_command(
+                    'seed_data', products=options['products'], orders=options['orders'],
+                    prefix=options['prefix'], stdout=self.stdout,
+                )
+                results = self.run(options)
+
+        self.report(results)
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline = {name: result['queries'] for name, result in results.items()}
+            baseline_path.write_text(json.dumps(baseline, indent=4, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        if baseline_path.exists():
+            self.check_baseline(results, json.loads(baseline_path.read_text()))
+
+    def endpoints(self, prefix):
+        try:
+            customer = User.objects.get(username=f'{prefix}-customer-0')
+            seller = User.objects.get(username=f'{prefix}-seller-0')
+        except User.DoesNotExist:
+            raise CommandError(f"Run seed_data --prefix {prefix} first")
+
+        product = Products.objects.order_by('id').first()
+        order = Order.objects.filter(user=customer).first()
+        shopping_list = ShoppingList.objects.filter(user=customer).first()
+
+        as_customer = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(customer)["access"]}'}
+        as_seller = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(seller)["access"]}'}
+
+        endpoints = {
+            'product-list': ('/api/product/', as_customer),
+            'product-detail': (f'/api/product/{product.id}/', as_customer),
+            'order-list': ('/api/orders/', as_customer),
+            'seller-products': ('/api/auth/seller/products/', as_seller),
+            'seller-orders': ('/api/auth/seller/orders/', as_seller),
+            'discount-days': ('/api/discount-day/', as_seller),
+            'seller-stats-discount': ('/api/seller/stats/?type=discount', as_seller),
+            'seller-stats-non-discount': ('/api/seller/stats/?type=non-discount', as_seller),
+            'seller-stats-products': ('/api/seller/stats/?type=discount&view=products', as_seller),
+        }
+        if order:
+            endpoints['order-detail'] = (f'/api/orders/{order.number}/', as_customer)
+        if shopping_list:
+            endpoints['shopping-list-items'] = (f'/api/auth/shopping-lists/{shopping_list.id}/items/', as_customer)
+        return endpoints
+
+    def run(self, options):
+        client = Client()
+        endpoints = self.endpoints(options['prefix'])
+        results = {}
+        # The database path of every endpoint, cache hits would hide query regressions
+        with override_settings(PRODUCT_CACHE_TIMEOUT=0):
+            for name, (url, headers) in endpoints.items():
+                results[name] = measure(self.requester(client, name, url, headers), repeat=options['repeat'])
+        for name in ('product-list', 'product-detail'):
+            url, headers = endpoints[name]
+            results[f'{name}-cached'] = measure(self.requester(client, name, url, headers), repeat=options['repeat'])
+        return results
+
+    def requester(self, client, name, url, headers):
+        def request():
+            response = client.get(url, **headers)
+            if response.status_code != 200:
+                raise CommandError(f"{name}: GET {url} returned {response.status_code}")
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return request
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<28}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>11}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['queries']:>9}{result['peak_kb']:>11.1f}"
+            )
+
+    def check_baseline(self, results, baseline):
+        regressions = [
+            f"{name}: {result['queries']} queries, baseline {baseline[name]}"
+            for name, result in results.items()
+            if name in baseline and result['queries'] > baseline[name]
+        ]
+        if regressions:
+            raise CommandError("Query count regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Query counts within baseline"))
@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from core.benchmarking import percentile
+from products.models import Products
+from products.services import OrderPlacementError, place_order
+
+PROFILES = {
+    # name: environment of the worker process
+    'untuned': {'DB_SQLITE_TUNING': '0'},
+    'tuned': {'DB_SQLITE_TUNING': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent order throughput on a fresh SQLite file with and without "
+        "the WAL / busy_timeout / IMMEDIATE transaction tuning"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=50, help="Orders placed by each thread")
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--profile', choices=PROFILES, help="Run one profile in this process (used internally)")
+
+    def handle(self, *args, **options):
+        if options['profile']:
+            if connection.vendor != 'sqlite':
+                raise CommandError("benchmark_checkout compares SQLite settings")
+            self.stdout.write(json.dumps(self.run_profile(options)))
+            return
+
+        results = {name: self.spawn(name, options) for name in PROFILES}
+
+        self.stdout.write(f"{'profile':<10}{'orders/s':>10}{'placed':>8}{'failed':>8}{'p95 ms':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<10}{result['throughput']:>10.1f}{result['placed']:>8}"
+                f"{result['failed']:>8}{result['p95_ms']:>9.1f}"
+            )
+        if results['untuned']['throughput']:
+            speedup = results['tuned']['throughput'] / results['untuned']['throughput']
+            self.stdout.write(self.style.SUCCESS(f"Tuned SQLite: {speedup:.1f}x the order throughput"))
+
+    def spawn(self, profile, options):
+        """Run one profile in a child process so it starts from its own settings and database file"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                **PROFILES[profile],
+                'DB_ENGINE': 'django.db.backends.sqlite3',
+                'DB_NAME': str(Path(directory) / 'checkout.sqlite3'),
+            }
+            command = [
+                sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark_checkout',
+                '--profile', profile,
+                '--threads', str(options['threads']),
+                '--orders', str(options['orders']),
+                '--products', str(options['products']),
+            ]
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"{profile} run failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_profile(self, options):
+        call_command('migrate', verbosity=0)
+        seller = User.objects.create_user(username='bench-seller')
+        buyers = [User.objects.create_user(username=f'bench-buyer-{i}') for i in range(options['threads'])]
+        products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10, stock=10 ** 6, user=seller)
+            for i in range(options['products'])
+        ])
+        product_ids = [product.id for product in products]
+        connection.close()
+
+        placed, failed, timings = [], [], []
+        lock = threading.Lock()
+
+        def buy(buyer):
+            rng = random.Random(buyer.id)
+            try:
+                for _ in range(options['orders']):
+                    items = [{'product_id': pid, 'quantity': 1} for pid in rng.sample(product_ids, 2)]
+                    started = time.perf_counter()
+                    try:
+                        place_order(buyer, 'Cash on Delivery', items)
+                    except (OperationalError, OrderPlacementError):
+                        with lock:
+                            failed.append(1)
+                        continue
+                    with lock:
+                        placed.append(1)
+                        timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyer,)) for buyer in buyers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'throughput': len(placed) / elapsed,
+            'placed': len(placed),
+            'failed': len(failed),
+            'p95_ms': percentile(timings, 95),
+        }
@@ -0,0 +1,78 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.benchmarking import measure, throwaway_database
+from products import search
+from products.models import Products
+from products.pagination import ProductSearchPagination
+from .seed_data import product_text
+
+QUERIES = (
+    'mango',            # common word
+    'ma',               # short prefix
+    'ripe ban',         # two words, prefix
+    'davao dragon',     # word from the description and one from the name
+    'lot 4242',         # rare
+    'durianx',          # no match, the scan reads every row
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with products and compare the first page of /api/product/search/ "
+        "served by the FTS5 index with icontains scans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--query', action='append', dest='queries', help="Search to run, repeatable")
+
+    def handle(self, *args, **options):
+        if not search.fulltext_available(connection):
+            raise CommandError("The full-text index needs SQLite")
+        with throwaway_database():
+            self.seed(options['products'], options['batch_size'])
+            results = {
+                query: {engine: self.run(query, engine, options['repeat']) for engine in ('fts', 'scan')}
+                for query in options['queries'] or QUERIES
+            }
+
+        self.stdout.write(f"{'query':<16}{'fts p50':>10}{'fts p95':>10}{'scan p50':>10}{'scan p95':>10}{'speedup':>9}")
+        for query, result in results.items():
+            fts, scan = result['fts'], result['scan']
+            speedup = scan['p50_ms'] / fts['p50_ms'] if fts['p50_ms'] else 0
+            self.stdout.write(
+                f"{query:<16}{fts['p50_ms']:>10.2f}{fts['p95_ms']:>10.2f}"
+                f"{scan['p50_ms']:>10.2f}{scan['p95_ms']:>10.2f}{speedup:>8.1f}x"
+            )
+
+    def seed(self, count, batch_size):
+        rng = random.Random(0)
+        seller = User.objects.create_user(username='bench-seller')
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                name, description = product_text(rng, i)
+                batch.append(Products(
+                    name=name, description=description, price=Decimal(rng.randint(100, 100000)) / 100,
+                    stock=rng.randint(1, 500), user=seller,
+                ))
+            # The triggers fill the index as the rows go in
+            Products.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {count} products")
+
+    def run(self, query, engine, repeat):
+        page_size = ProductSearchPagination.page_size
+        products = Products.catalog.all()
+
+        def first_page():
+            results = search.search(products, query, engine=engine)
+            return list(results.order_by(*ProductSearchPagination.ordering)[:page_size + 1])
+
+        return measure(first_page, repeat=repeat)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from discounts.models import DiscountDay
+from discounts.views import local_day_bounds
+from products.models import Products, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Print the query plan and timing of the hottest API filters against the current database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query used for the timing")
+
+    def hot_queries(self):
+        product = Products.objects.filter(user__isnull=False).first()
+        order = Order.objects.filter(user__isnull=False).first()
+        if product is None or order is None:
+            raise CommandError("The database needs products and orders, seed it first")
+        seller = product.user
+        day = timezone.localdate()
+        day_start, day_end = local_day_bounds(day)
+
+        return {
+            'catalog page': Products.catalog.order_by('-created_at', '-id')[:51],
+            'seller products': Products.catalog.filter(user=seller),
+            'out of stock products': Products.objects.filter(status=Products.StatusofProduct.OUT_OF_STOCK),
+            'discount day lookup': DiscountDay.objects.filter(seller=seller, date=day, is_active=True),
+            'discount day sales': OrderItem.objects.filter(
+                product__user=seller, is_discount_day=True, created_at__gte=day_start, created_at__lt=day_end
+            ),
+            'product sales on a day': OrderItem.objects.filter(
+                product=product, created_at__gte=day_start, created_at__lt=day_end, is_discount_day=True
+            ),
+            'customer order history': Order.objects.filter(user=order.user).order_by('-created_at')[:50],
+        }
+
+    def handle(self, *args, **options):
+        for name, queryset in self.hot_queries().items():
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - started) / options['repeat'] * 1000
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({elapsed:.2f} ms)"))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
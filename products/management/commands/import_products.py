@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from products import bulk
+
+
+class Command(BaseCommand):
+    help = "Create or update a seller's products from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help="Username of the seller owning the products")
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=bulk.FORMATS, help="File format, guessed from the extension by default")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"Seller {options['seller']} does not exist")
+
+        file_format = options['type'] or bulk.format_from_name(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = bulk.import_products(
+                    seller, bulk.read_rows(stream, file_format), chunk_size=options['chunk_size']
+                )
+        except (OSError, bulk.BulkImportError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        summary = f"Created {result['created']}, updated {result['updated']}, {len(result['errors'])} rows rejected"
+        if result['stopped_at_line'] is not None:
+            raise CommandError(f"{summary}. Stopped at line {result['stopped_at_line']}, the rest was not imported")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,169 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from clients.models import UserProfile, ShoppingList, ShoppingListItem
+from discounts.models import DiscountDay, SellerDailySales
+from products.models import Products, Order, OrderItem, SellerOrder
+
+# Product names and descriptions are built from these, so searches have realistic hits
+ADJECTIVES = ('Fresh', 'Ripe', 'Organic', 'Sweet', 'Green', 'Dried', 'Frozen', 'Local', 'Premium', 'Baby')
+PRODUCE = (
+    'Mango', 'Banana', 'Pineapple', 'Papaya', 'Calamansi', 'Coconut', 'Rambutan', 'Lanzones', 'Durian',
+    'Mangosteen', 'Dragon Fruit', 'Avocado', 'Tomato', 'Eggplant', 'Okra', 'Squash', 'Ampalaya', 'Cabbage',
+    'Carrot', 'Potato', 'Onion', 'Garlic', 'Ginger', 'Kangkong', 'Pechay', 'Sitaw', 'Malunggay', 'Jackfruit',
+)
+ORIGINS = ('Davao', 'Benguet', 'Cebu', 'Guimaras', 'Batangas', 'Bukidnon', 'Iloilo', 'Pampanga', 'Quezon', 'Samar')
+UNITS = ('per kilo', 'per piece', 'per bundle', 'per box', 'per pack')
+
+
+def product_text(rng, number):
+    """A random (name, description) for the number-th synthetic product"""
+    produce = rng.choice(PRODUCE)
+    name = f'{rng.choice(ADJECTIVES)} {produce}'
+    description = f'{rng.choice(ADJECTIVES)} {produce.lower()} from {rng.choice(ORIGINS)}, {rng.choice(UNITS)}, lot {number}'
+    return name, description
+
+
+class Command(BaseCommand):
+    help = "Seed the database with synthetic customers, sellers, products, orders and discount days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--sellers', type=int, default=10)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--discount-days', type=int, default=10, help="Discount days per seller")
+        parser.add_argument('--list-items', type=int, default=20, help="Items in each customer's shopping list")
+        parser.add_argument('--days', type=int, default=90, help="Spread orders over this many past days")
+        parser.add_argument('--prefix', default='seed', help="Prefix of the generated usernames")
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users prefixed {prefix}- already exist, pick another --prefix")
+
+        with transaction.atomic():
+            # One hash for everybody, hashing is by far the slowest part otherwise
+            password = make_password(options['password'])
+            sellers = self.create_users(f'{prefix}-seller', options['sellers'], 'seller', password)
+            customers = self.create_users(f'{prefix}-customer', options['customers'], 'customer', password)
+            products = self.create_products(sellers, options['products'])
+            self.create_discount_days(sellers, options['discount_days'])
+            self.create_orders(customers, products, options['orders'], options['items_per_order'], options['days'])
+            self.create_shopping_lists(customers, products, options['list_items'])
+            SellerDailySales.rebuild()
+            SellerOrder.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(sellers)} sellers, {len(customers)} customers, {len(products)} products "
+            f"and {options['orders']} orders"
+        ))
+
+    def create_users(self, prefix, count, role, password):
+        User.objects.bulk_create([
+            User(username=f'{prefix}-{i}', email=f'{prefix}-{i}@example.com', password=password)
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        users = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('id'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, role=role, is_seller_approved=role == 'seller') for user in users
+        ], batch_size=self.batch_size)
+        return users
+
+    def create_products(self, sellers, count):
+        if not sellers:
+            return []
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, count)):
+                name, description = product_text(self.random, i)
+                stock = self.random.randint(0, 500)
+                batch.append(Products(
+                    name=name,
+                    description=description,
+                    price=Decimal(self.random.randint(100, 100000)) / 100,
+                    stock=stock,
+                    status=Products.StatusofProduct.AVAILABLE if stock else Products.StatusofProduct.OUT_OF_STOCK,
+                    user=self.random.choice(sellers),
+                ))
+            Products.objects.bulk_create(batch)
+        return list(Products.objects.filter(user__in=sellers).only('id', 'price', 'user_id'))
+
+    def create_discount_days(self, sellers, per_seller):
+        today = timezone.localdate()
+        DiscountDay.objects.bulk_create([
+            DiscountDay(
+                seller=seller,
+                date=today - datetime.timedelta(days=day),
+                discount_percentage=Decimal(self.random.choice([5, 10, 15, 20, 25])),
+            )
+            for seller in sellers
+            for day in range(per_seller)
+        ], batch_size=self.batch_size)
+
+    def create_orders(self, customers, products, count, items_per_order, days):
+        if not customers or not products:
+            return
+        discounts = {
+            (day.seller_id, day.date): day.discount_percentage
+            for day in DiscountDay.objects.filter(is_active=True)
+        }
+        today = timezone.localdate()
+        now = timezone.localtime()
+
+        orders, items, links, created_at = [], [], [], {}
+        for _ in range(count):
+            order = Order(user=self.random.choice(customers))
+            orders.append(order)
+            day = today - datetime.timedelta(days=self.random.randrange(max(days, 1)))
+            created_at[order.pk] = now.replace(year=day.year, month=day.month, day=day.day)
+            for product in self.random.sample(products, min(items_per_order, len(products))):
+                discount = discounts.get((product.user_id, day))
+                item = OrderItem(
+                    product=product,
+                    quantity=self.random.randint(1, 5),
+                    unit_price=product.price,
+                    is_discount_day=discount is not None,
+                    discount_percentage=discount or 0,
+                )
+                items.append(item)
+                created_at[item.pk] = created_at[order.pk]
+                links.append(Order.order_item.through(order_id=order.pk, orderitem_id=item.pk))
+
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+        OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+        Order.order_item.through.objects.bulk_create(links, batch_size=self.batch_size)
+
+        # auto_now_add stamps everything with now, spread the history over past days
+        for model, rows in ((Order, orders), (OrderItem, items)):
+            by_time = {}
+            for row in rows:
+                by_time.setdefault(created_at[row.pk], []).append(row.pk)
+            for moment, pks in by_time.items():
+                for start in range(0, len(pks), 500):
+                    model.objects.filter(pk__in=pks[start:start + 500]).update(created_at=moment)
+
+    def create_shopping_lists(self, customers, products, per_list):
+        if not per_list or not products:
+            return
+        ShoppingList.objects.bulk_create([
+            ShoppingList(name='Wishlist', user=customer) for customer in customers
+        ], batch_size=self.batch_size)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(shopping_list=shopping_list, product_id=product.id, quantity=1)
+            for shopping_list in ShoppingList.objects.filter(user__in=customers, name='Wishlist')
+            for product in self.random.sample(products, min(per_list, len(products)))
+        ], batch_size=self.batch_size)
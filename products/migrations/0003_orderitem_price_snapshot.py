@@ -0,0 +1,55 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    """Copy the current product price and the matching discount day onto existing order items"""
+    OrderItem = apps.get_model('products', 'OrderItem')
+    Products = apps.get_model('products', 'Products')
+    DiscountDay = apps.get_model('discounts', 'DiscountDay')
+
+    OrderItem.objects.update(
+        unit_price=Subquery(Products.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+
+    items = list(
+        OrderItem.objects.filter(is_discount_day=True)
+        .select_related('product')
+        .only('number', 'created_at', 'product__user_id')
+    )
+    seller_ids = {item.product.user_id for item in items}
+    discounts = {
+        (day.seller_id, day.date): day.discount_percentage
+        for day in DiscountDay.objects.filter(seller_id__in=seller_ids, is_active=True)
+    }
+    for item in items:
+        # OrderItem.discount_amount used to look the discount day up by created_at.date()
+        item.discount_percentage = discounts.get((item.product.user_id, item.created_at.date()), 0)
+    OrderItem.objects.bulk_update(items, ['discount_percentage'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0001_initial'),
+        ('products', '0002_delete_status_delete_statusofdelivery_order_payment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='discount_percentage',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10),
+        ),
+    ]
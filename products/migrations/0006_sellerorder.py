@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_existing_orders(apps, schema_editor):
+    """Link every existing order to the sellers of its items, see SellerOrder.rebuild"""
+    Order = apps.get_model('products', 'Order')
+    SellerOrder = apps.get_model('products', 'SellerOrder')
+
+    pairs = (
+        Order.order_item.through.objects.filter(orderitem__product__user__isnull=False)
+        .values_list('orderitem__product__user_id', 'order_id', 'order__created_at')
+        .distinct()
+    )
+    SellerOrder.objects.bulk_create([
+        SellerOrder(seller_id=seller_id, order_id=order_id, created_at=created_at)
+        for seller_id, order_id, created_at in pairs.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_products_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_links', to='products.order')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', '-created_at', '-id'], name='sellerorder_inbox_idx')],
+                'unique_together': {('seller', 'order')},
+            },
+        ),
+        migrations.RunPython(link_existing_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 09:05
+
+import django.db.models.deletion
+import products.search
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 table and triggers on SQLite, nothing elsewhere, see products.search"""
+    products.search.ensure_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    products.search.drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_sellerorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearch',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='products.products')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', products.search.FullTextField(db_column='products_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'products_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:20
+
+import products.facets
+from django.db import migrations, models
+
+
+def count_facets(apps, schema_editor):
+    """Count the existing products, see ProductFacetCount.rebuild"""
+    Products = apps.get_model('products', 'Products')
+    ProductFacetCount = apps.get_model('products', 'ProductFacetCount')
+
+    counts = products.facets.count(Products.objects.all())
+    ProductFacetCount.objects.bulk_create([
+        ProductFacetCount(dimension=dimension, value=value, count=count)
+        for (dimension, value), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_productsearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('seller', 'Seller'), ('price', 'Price'), ('created', 'Created')], max_length=10)),
+                ('value', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('dimension', 'value')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['price', 'id'], name='product_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['name', 'id'], name='product_active_name_idx'),
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
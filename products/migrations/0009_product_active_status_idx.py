@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productfacetcount_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='products',
+            name='product_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['status'], name='product_active_status_idx'),
+        ),
+    ]
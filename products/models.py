@@ -1,8 +1,17 @@
-from django.db import models
+from collections import Counter
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save
+from django.db.models.sql.where import AND
 import uuid
 from django.conf import settings
 from django.utils import timezone
 from clients.models import UserProfile
+from . import facets
+from .cache import invalidate_products
+from .images import schedule_variants, variants_outdated
+from .search import SEARCH_TABLE, FullTextField, ensure_search_index
 
 # Create your models here.
 
@@ -12,6 +21,148 @@ from clients.models import UserProfile
 # Many To Many
 
 
+class ProductQuerySet(models.QuerySet):
+    """
+    Stock changes are single UPDATE statements evaluated by the database, so
+    concurrent checkouts can never take more units than there are and the
+    other columns of the row are left untouched
+    """
+
+    def reserve_stock(self, quantity):
+        """
+        Take ``quantity`` units from every product that still has them.
+        Returns the number of products reserved, rows without enough stock are left as they are.
+        """
+        reserving = self.filter(stock__gte=quantity)
+        out_of_stock = Products.StatusofProduct.OUT_OF_STOCK
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Locked, so the UPDATE changes exactly these rows. Only products giving up their
+            # last units change facet, from their status to out of stock
+            rows = list(reserving.select_for_update().values_list('pk', 'stock', 'status', 'deleted_at'))
+            if not rows:
+                return 0
+            delta = Counter()
+            for pk, stock, status, deleted_at in rows:
+                if stock == quantity and status != out_of_stock and deleted_at is None:
+                    delta[('status', status)] -= 1
+                    delta[('status', out_of_stock)] += 1
+            # SET expressions see the row as it was, so stock=quantity means this takes the last unit
+            reserved = reserving._update_rows([pk for pk, *_ in rows], {
+                'stock': F('stock') - quantity,
+                'status': Case(When(stock=quantity, then=Value(out_of_stock)), default=F('status')),
+            })
+            ProductFacetCount.record(delta)
+        return reserved
+
+    def restock(self, quantity):
+        """Add ``quantity`` units and mark the products available"""
+        return self.update(
+            stock=F('stock') + quantity,
+            status=Products.StatusofProduct.AVAILABLE,
+        )
+
+    def set_stock(self, stock):
+        """Overwrite the stock and keep the status in line with it"""
+        if stock > 0:
+            status = Products.StatusofProduct.AVAILABLE
+        else:
+            status = Products.StatusofProduct.OUT_OF_STOCK
+        return self.update(stock=stock, status=status)
+
+    def soft_delete(self):
+        """Soft delete the live products of the queryset with one UPDATE, returns how many"""
+        return self.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+    soft_delete.queryset_only = True
+
+    def restore(self):
+        """Bring back the soft deleted products of the queryset with one UPDATE, use Products.all_objects"""
+        return self.filter(deleted_at__isnull=False).update(deleted_at=None)
+    restore.queryset_only = True
+
+    def update(self, **kwargs):
+        # Stock changes skip save(), keep the response cache and the facet counts in line here
+        dimensions = facets.updated_dimensions(kwargs)
+        if not dimensions:
+            return self._update_rows(self._filtered_pks(), kwargs)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            # SQLite transactions take the write lock up front (transaction_mode in core.settings), no other
+            # writer can change the rows between the counts and the UPDATE
+            delta = facets.update_changes(self, dimensions, kwargs)
+            rows = self._update_rows(self._filtered_pks(), kwargs)
+            ProductFacetCount.record(delta)
+        return rows
+
+    def _update_rows(self, pks, kwargs):
+        # pks None stands for products the filter does not name, see invalidate_products
+        rows = super().update(**kwargs)
+        if rows:
+            invalidate_products(pks, using=self.db)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        created = [obj for obj in objs if obj.pk is not None]
+        if created:
+            invalidate_products((), using=self.db)
+            delta = Counter()
+            for obj in created:
+                delta.update(facets.changes(None, facets.state_of(obj)))
+            ProductFacetCount.record(delta)
+        return objs
+
+    def _filtered_pks(self):
+        """The pks of a queryset filtered with pk=... or pk__in=[...], None for anything else"""
+        where = self.query.where
+        if where.connector != AND or where.negated:
+            return None
+        for lookup in where.children:
+            target = getattr(getattr(lookup, 'lhs', None), 'target', None)
+            if target is None or not target.primary_key or hasattr(lookup.rhs, 'resolve_expression'):
+                continue
+            if lookup.lookup_name == 'exact':
+                return [lookup.rhs]
+            if lookup.lookup_name == 'in':
+                return list(lookup.rhs)
+        return None
+
+
+class ActiveProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    """
+    Live products only, soft deleted rows never leave the database. Their
+    filter matches the condition of the partial indexes on Products, so
+    every query through this manager can use them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class CatalogManager(ActiveProductManager):
+    """
+    Products ready for the catalog serializers: the seller row is joined in
+    and only the columns the API reads are selected, so listing N products
+    costs one query instead of N + 1
+    """
+    fields = (
+        'id',
+        'name',
+        'description',
+        'price',
+        'stock',
+        'status',
+        'image',
+        'image_variants',
+        'created_at',
+        'deleted_at',
+        'user__id',
+        'user__username',
+    )
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('user').only(*self.fields)
+
+
 class Products(models.Model):
     class StatusofProduct(models.TextChoices):
         AVAILABLE = "Available"
@@ -27,12 +178,45 @@ class Products(models.Model):
         default=StatusofProduct.AVAILABLE
     )
     image = models.ImageField(upload_to="products/", null=True, blank=True)
+    # Resized copies of image, filled in the background by products.images
+    image_variants = models.JSONField(default=dict, blank=True)
     # Add relationship to user (seller)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='products', null=True, blank=True)
 
     # Soft delete field
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ActiveProductManager()
+    # Soft deleted products too, for the admin and restoring
+    all_objects = ProductQuerySet.as_manager()
+    catalog = CatalogManager()
+
+    class Meta:
+        indexes = [
+            # Partial indexes only hold live rows, the catalog never reads soft deleted ones
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(deleted_at__isnull=True),
+                name='product_active_catalog_idx',
+            ),
+            models.Index(
+                fields=['user'], condition=models.Q(deleted_at__isnull=True),
+                name='product_active_seller_idx',
+            ),
+            # The other catalog orderings, see products.pagination.CATALOG_ORDERINGS
+            models.Index(
+                fields=['price', 'id'], condition=models.Q(deleted_at__isnull=True),
+                name='product_active_price_idx',
+            ),
+            models.Index(
+                fields=['name', 'id'], condition=models.Q(deleted_at__isnull=True),
+                name='product_active_name_idx',
+            ),
+            models.Index(
+                fields=['status'], condition=models.Q(deleted_at__isnull=True),
+                name='product_active_status_idx',
+            ),
+        ]
+
     """
      add null true and black true if
 
@@ -52,24 +236,151 @@ class Products(models.Model):
         """Soft delete: set deleted_at timestamp instead of removing from db"""
         if soft:
             self.deleted_at = timezone.now()
-            self.save()
+            self.save(update_fields=['deleted_at'])
         else:
             super().delete(*args, **kwargs)
 
     def restore(self):
         """Restore a soft deleted product"""
         self.deleted_at = None
-        self.save()
+        self.save(update_fields=['deleted_at'])
+
+
+def invalidate_product_cache(sender, instance, using=None, **kwargs):
+    invalidate_products([instance.pk], using=using)
+
+post_save.connect(invalidate_product_cache, sender=Products)
+
+
+def process_product_image(sender, instance, **kwargs):
+    if variants_outdated(instance):
+        schedule_variants(instance.pk)
+
+post_save.connect(process_product_image, sender=Products)
+post_delete.connect(invalidate_product_cache, sender=Products)
+
+
+class ProductFacetCount(models.Model):
+    """
+    Live products per facet value: status, seller, price range and month
+    created, see products.facets. Adjusted as products are written, so the
+    catalog facets are one small read instead of a GROUP BY per dimension.
+    Rebuild it from the products with ``ProductFacetCount.rebuild()``.
+    """
+    class Dimension(models.TextChoices):
+        STATUS = 'status'
+        SELLER = 'seller'
+        PRICE = 'price'
+        CREATED = 'created'
+    dimension = models.CharField(max_length=10, choices=Dimension.choices)
+    value = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.dimension}={self.value}: {self.count}"
+
+    class Meta:
+        unique_together = ('dimension', 'value')
 
     @classmethod
-    def all_objects(cls):
-        """Return all products, including soft deleted ones"""
-        return cls.objects.all()
+    def record(cls, delta):
+        """Apply a {(dimension, value): change} mapping, see facets.changes"""
+        for (dimension, value), change in delta.items():
+            if not change:
+                continue
+            rows = cls.objects.filter(dimension=dimension, value=value)
+            if rows.update(count=F('count') + change) or change < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(dimension=dimension, value=value, count=change)
+            except IntegrityError:
+                # Another write created the row first
+                rows.update(count=F('count') + change)
 
     @classmethod
-    def objects_active(cls):
-        """Return only active (non-deleted) products"""
-        return cls.objects.filter(deleted_at__isnull=True)
+    def rebuild(cls):
+        """Recount every facet from the live products"""
+        counts = facets.count(Products.objects.all())
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([
+                cls(dimension=dimension, value=value, count=count)
+                for (dimension, value), count in counts.items()
+            ], batch_size=1000)
+        return len(counts)
+
+    @classmethod
+    def _count_rows(cls):
+        return cls.objects.filter(count__gt=0).order_by('dimension', 'value').values_list('dimension', 'value', 'count')
+
+    @classmethod
+    def _group(cls, rows):
+        result = {dimension: {} for dimension in cls.Dimension.values}
+        for dimension, value, count in rows:
+            result[dimension][value] = count
+        return result
+
+    @classmethod
+    def counts(cls):
+        """{dimension: {value: count}} of every dimension, empty values left out"""
+        return cls._group(cls._count_rows())
+
+    @classmethod
+    async def acounts(cls):
+        return cls._group([row async for row in cls._count_rows()])
+
+
+def remember_facet_state(sender, instance, **kwargs):
+    # Only the loaded columns, reading a deferred one here would cost a query per instance
+    instance._facet_state = {field: instance.__dict__[field] for field in facets.FIELDS if field in instance.__dict__}
+
+
+def update_facet_counts(sender, instance, created, **kwargs):
+    state = facets.state_of(instance)
+    # Columns that were deferred are not saved either, their old value is the current one
+    old = None if created else {**state, **instance._facet_state}
+    ProductFacetCount.record(facets.changes(old, state))
+    instance._facet_state = state
+
+
+def remove_facet_counts(sender, instance, **kwargs):
+    # The row is gone, deferred columns cannot be loaded anymore
+    loaded = {field: instance.__dict__[field] for field in facets.FIELDS if field in instance.__dict__}
+    state = {**instance._facet_state, **loaded}
+    if len(state) == len(facets.FIELDS):
+        ProductFacetCount.record(facets.changes(state, None))
+
+post_init.connect(remember_facet_state, sender=Products)
+post_save.connect(update_facet_counts, sender=Products)
+post_delete.connect(remove_facet_counts, sender=Products)
+
+
+class ProductSearch(models.Model):
+    """
+    Row of the FTS5 index over product names and descriptions, SQLite only.
+    The table and the triggers filling it are created outside the ORM, see
+    products.search. Query it through Products: search_entry__document__match.
+    """
+    product = models.OneToOneField(
+        Products, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_entry',
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = FullTextField(db_column=SEARCH_TABLE)
+    # BM25 score of the current MATCH, lower is better
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = SEARCH_TABLE
+
+
+def create_search_index(sender, using, **kwargs):
+    ensure_search_index(connections[using])
+
+post_migrate.connect(create_search_index, sender=ProductSearch._meta.app_config)
 
 
 # attrbutes=> snake_case
@@ -96,17 +407,25 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name="order_items")
     # Add field to track if this order item was during a discount day
     is_discount_day = models.BooleanField(default=False)
+    # Price and discount at the time of purchase, the money properties below only read these
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True)
+    discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
 
     @property # Class Decorator Use for additional Functions
     def sub_total(self): # Class method refers
-        return  self.product.price * self.quantity
+        return  self.unit_price * self.quantity
 
     @property
     def original_sub_total(self):
         """
         Calculate the original price without discount
         """
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
 
     @property
     def discount_amount(self):
@@ -114,17 +433,7 @@ class OrderItem(models.Model):
         Calculate the discount amount if applicable
         """
         if self.is_discount_day:
-            # Get the discount percentage for the date of this order item
-            try:
-                from discounts.models import DiscountDay
-                discount_day = DiscountDay.objects.get(
-                    seller=self.product.user,
-                    date=self.created_at.date(),
-                    is_active=True
-                )
-                return self.original_sub_total * (discount_day.discount_percentage / 100)
-            except DiscountDay.DoesNotExist:
-                return 0
+            return self.original_sub_total * (self.discount_percentage / 100)
         return 0
 
     @property
@@ -138,6 +447,11 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"Product: {self.product} Subtotal: {self.sub_total}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'is_discount_day'], name='orderitem_product_day_idx'),
+        ]
     
 
 
@@ -173,6 +487,61 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.number} - Status: {self.status}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_recent_idx'),
+        ]
+
+
+class SellerOrder(models.Model):
+    """
+    One row per seller with items in an order, written when the order is
+    placed. A seller's order inbox is an index range scan on
+    (seller, created_at) instead of a join through every order item with
+    DISTINCT on top. Rebuild it from history with ``SellerOrder.rebuild()``.
+    """
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='seller_orders')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='seller_links')
+    # Copy of order.created_at, so the inbox is ordered by the index alone
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Order {self.order_id} of seller {self.seller_id}"
+
+    class Meta:
+        unique_together = ('seller', 'order')
+        indexes = [
+            models.Index(fields=['seller', '-created_at', '-id'], name='sellerorder_inbox_idx'),
+        ]
+
+    @classmethod
+    def record(cls, order, order_items):
+        """Link the order to the sellers of its items, the items need their product loaded"""
+        seller_ids = {item.product.user_id for item in order_items if item.product.user_id}
+        cls.objects.bulk_create(
+            [cls(seller_id=seller_id, order=order, created_at=order.created_at) for seller_id in seller_ids],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def rebuild(cls, seller=None):
+        """Recompute the links from the order items, for one seller or everybody"""
+        links = Order.order_item.through.objects.filter(orderitem__product__user__isnull=False)
+        existing = cls.objects.all()
+        if seller is not None:
+            links = links.filter(orderitem__product__user=seller)
+            existing = existing.filter(seller=seller)
+
+        pairs = links.values_list('orderitem__product__user_id', 'order_id', 'order__created_at').distinct()
+        rows = [
+            cls(seller_id=seller_id, order_id=order_id, created_at=created_at)
+            for seller_id, order_id, created_at in pairs.iterator()
+        ]
+        with transaction.atomic():
+            existing.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
 
 
 
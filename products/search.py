@@ -0,0 +1,128 @@
+"""
+Full-text product search.
+
+On SQLite, products_search is an FTS5 index over Products.name and
+description. It is an external content table: it stores only the index and
+reads the text from products_products, and triggers on that table keep it
+in sync for every INSERT, UPDATE and DELETE, bulk operations included.
+Terms match as prefixes and results are ranked with BM25, a name hit
+weighing ten times a description hit.
+
+Other databases have no index and fall back to icontains scans.
+"""
+import re
+
+from django.db import connections, models
+from django.db.models import F, Q, Value
+
+SEARCH_TABLE = 'products_search'
+MAX_TERMS = 8
+# Relative BM25 weight of the name and description columns
+RANKING = 'bm25(10.0, 1.0)'
+
+TRIGGERS = {
+    'products_search_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS products_search_insert AFTER INSERT ON products_products BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+    'products_search_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS products_search_delete AFTER DELETE ON products_products BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    'products_search_update': f"""
+        CREATE TRIGGER IF NOT EXISTS products_search_update AFTER UPDATE OF name, description ON products_products
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+class FullTextField(models.TextField):
+    """The hidden FTS5 column named after the table, only used on the left of MATCH"""
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+def fulltext_available(connection):
+    return connection.vendor == 'sqlite'
+
+
+def ensure_search_index(connection):
+    """
+    Create the index and its triggers where they are missing and fill the
+    index from the products table. Runs after every migrate: SQLite drops a
+    table's triggers when a migration has to rebuild the table.
+    """
+    if not fulltext_available(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND name IN (%s, %s, %s))",
+            [SEARCH_TABLE, *TRIGGERS],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing >= {SEARCH_TABLE, *TRIGGERS}:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "name, description, content='products_products', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        for statement in TRIGGERS.values():
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', %s)", [RANKING])
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(connection):
+    if not fulltext_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def search_terms(text):
+    """The words of a search, lower cased, at most MAX_TERMS"""
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def match_expression(terms):
+    # Quoted so FTS5 operators in the input stay plain words, * makes every term a prefix
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(queryset, text, engine=None):
+    """
+    Narrow a Products queryset to the products matching every word of
+    ``text`` and annotate ``rank``: lower is better, order by ('rank', 'id').
+    ``engine`` is 'fts' or 'scan', by default the index when the database has one.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+    if engine is None:
+        engine = 'fts' if fulltext_available(connections[queryset.db]) else 'scan'
+
+    if engine == 'fts':
+        return queryset.filter(search_entry__document__match=match_expression(terms)).annotate(
+            rank=F('search_entry__rank')
+        )
+    for term in terms:
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    return queryset.annotate(rank=Value(0.0, output_field=models.FloatField()))
@@ -4,11 +4,30 @@ import re
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
+from .images import variant_urls
+from .pagination import CATALOG_ORDERINGS
+
+
+def sanitize_product_text(value):
+    """Single spaces and title case, how product names and descriptions are stored"""
+    return " ".join(value.split()).title().strip()
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized variants of the product's image, see products.images"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, product):
+        return variant_urls(product)
 
 
 class ProductSerializer(serializers.ModelSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
     store_owner = serializers.ReadOnlyField(source='user.username')
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Products
@@ -19,6 +38,8 @@ class ProductSerializer(serializers.ModelSerializer):
             'price',
             'stock',
             'status',
+            'image',
+            'image_variants',
             'user_id',
             'store_owner',
             'deleted_at'
@@ -49,6 +70,42 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProductFilterSerializer(serializers.Serializer):
+    """Catalog filters shared by the product list and search query parameters"""
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    status = serializers.ChoiceField(choices=Products.StatusofProduct.choices, required=False)
+    seller = serializers.IntegerField(required=False)
+    created_after = serializers.DateField(required=False)
+    created_before = serializers.DateField(required=False)
+
+    def filters(self):
+        """The validated filters as Products lookups"""
+        lookups = {
+            'min_price': 'price__gte',
+            'max_price': 'price__lte',
+            'status': 'status',
+            'seller': 'user_id',
+            'created_after': 'created_at__gte',
+            'created_before': 'created_at__lte',
+        }
+        return {
+            lookup: self.validated_data[name]
+            for name, lookup in lookups.items() if name in self.validated_data
+        }
+
+
+class ProductListQuerySerializer(ProductFilterSerializer):
+    """Query parameters of GET /api/product/"""
+    ordering = serializers.ChoiceField(choices=list(CATALOG_ORDERINGS), default='newest')
+    facets = serializers.BooleanField(default=False)
+
+
+class ProductSearchQuerySerializer(ProductFilterSerializer):
+    """Query parameters of GET /api/product/search/"""
+    q = serializers.CharField(max_length=200)
+
+
 class ProductMutationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Products
@@ -95,7 +152,11 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ('number', 'quantity', 'created_at', 'updated_at', 'status', 'product', 'is_discount_day', 'sub_total')
+        fields = (
+            'number', 'quantity', 'created_at', 'updated_at', 'status', 'product',
+            'unit_price', 'is_discount_day', 'discount_percentage', 'sub_total'
+        )
+        read_only_fields = ('unit_price', 'discount_percentage')
 
 
 class OrderItemCreateSerializer(serializers.ModelSerializer):
@@ -150,24 +211,16 @@ class OrderSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        items_data = validated_data.pop('items', [])
-        card_number = validated_data.pop('card_number', None)
-        # The 'user' is passed separately in the view
-
-        # Create the order
-        order = Order.objects.create(**validated_data)
-
-        # Create and associate order items
-        order_items = []
-        for item_data in items_data:
-            # Remove product_id from the data since it's not a field on OrderItem
-            item_data.pop('product_id', None)
-            order_item = OrderItem.objects.create(**item_data)
-            order_items.append(order_item)
-
-        # Add order items to the order
-        order.order_item.set(order_items)
-
-        return order
+        # Same path as the order views: stock, price snapshots, daily sales and the seller inbox
+        # are all written by place_order. The 'user' is passed separately in the view
+        from .services import OrderPlacementError, place_order
+        items = [
+            {'product_id': item['product'].pk, 'quantity': item.get('quantity', 1)}
+            for item in validated_data.get('items', [])
+        ]
+        try:
+            return place_order(validated_data['user'], validated_data.get('payment', 'Cash on Delivery'), items)
+        except OrderPlacementError as e:
+            raise serializers.ValidationError({'error': str(e)})
 
 
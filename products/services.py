@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
+
+from discounts.models import DiscountDay, SellerDailySales
+from .models import Products, Order, OrderItem, SellerOrder
+
+
+class OrderPlacementError(Exception):
+    """Raised when an order cannot be placed, the message is safe to show to the customer"""
+
+
+def _parse_items(items_data):
+    """Turn the request's items into (product_id, quantity) lines"""
+    lines = []
+    for item_data in items_data:
+        product_id = item_data.get('product_id')
+        if not product_id:
+            continue
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise OrderPlacementError(f'Product with id {product_id} does not exist')
+        try:
+            quantity = int(item_data.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise OrderPlacementError(f'Invalid quantity for product {product_id}')
+        if quantity < 1:
+            raise OrderPlacementError(f'Invalid quantity for product {product_id}')
+        lines.append((product_id, quantity))
+    return lines
+
+
+def place_order(user, payment, items_data):
+    """
+    Create an order with its items and take the stock in one transaction.
+
+    Each item keeps the price and discount it was sold at.
+    The number of queries does not depend on the number of lines in the cart:
+    products and the day's discount days are fetched once, the items are bulk
+    inserted and stock is taken with one conditional UPDATE per product
+    (``ProductQuerySet.reserve_stock``), so concurrent orders cannot oversell.
+    The sellers' daily sales rollup and order inbox links are updated in the
+    same transaction.
+    Any failure rolls the whole order back.
+    """
+    lines = _parse_items(items_data)
+
+    # Several lines may point at the same product, check stock on the total
+    totals = {}
+    for product_id, quantity in lines:
+        totals[product_id] = totals.get(product_id, 0) + quantity
+
+    with transaction.atomic():
+        products = Products.objects.select_for_update().in_bulk(list(totals))
+        for product_id, quantity in totals.items():
+            product = products.get(product_id)
+            if product is None:
+                raise OrderPlacementError(f'Product with id {product_id} does not exist')
+            if product.stock < quantity:
+                raise OrderPlacementError(
+                    f'Insufficient stock for {product.name}. Available: {product.stock}, Requested: {quantity}'
+                )
+
+        order = Order.objects.create(user=user, payment=payment)
+
+        seller_ids = {product.user_id for product in products.values() if product.user_id}
+        discounts = dict(
+            DiscountDay.objects.filter(
+                seller_id__in=seller_ids, date=timezone.localdate(), is_active=True
+            ).values_list('seller_id', 'discount_percentage')
+        )
+
+        order_items = []
+        for product_id, quantity in lines:
+            product = products[product_id]
+            order_items.append(OrderItem(
+                product=product,
+                quantity=quantity,
+                unit_price=product.price,
+                is_discount_day=product.user_id in discounts,
+                discount_percentage=discounts.get(product.user_id, 0),
+            ))
+        OrderItem.objects.bulk_create(order_items)
+        SellerDailySales.record(order_items)
+        SellerOrder.record(order, order_items)
+        Through = Order.order_item.through
+        Through.objects.bulk_create([
+            Through(order_id=order.pk, orderitem_id=item.pk) for item in order_items
+        ])
+
+        for product_id, quantity in totals.items():
+            reserved = Products.objects.filter(pk=product_id).reserve_stock(quantity)
+            if not reserved:
+                product = products[product_id]
+                raise OrderPlacementError(
+                    f'Insufficient stock for {product.name}. Requested: {quantity}'
+                )
+
+        prefetch_related_objects(
+            [order], Prefetch('order_item', queryset=OrderItem.objects.select_related('product'))
+        )
+    return order
+
+
+def delete_order(order):
+    """Delete an order with its items and take them out of the sellers' daily sales"""
+    with transaction.atomic():
+        order_items = list(order.order_item.select_related('product'))
+        SellerDailySales.record(order_items, sign=-1)
+        OrderItem.objects.filter(pk__in=[item.pk for item in order_items]).delete()
+        order.delete()
@@ -0,0 +1,923 @@
+import datetime
+import gzip
+import io
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from clients.views import get_tokens_for_user
+from discounts.models import DiscountDay, SellerDailySales
+from . import archival, facets, search
+from .cache import CATALOG_VERSION_KEY, GENERATION_KEY
+from .images import FORMATS, VARIANTS, ImageTooLarge, render_variants
+from .models import Products, ProductFacetCount, Order, OrderItem, SellerOrder
+from .services import OrderPlacementError, place_order
+from .views import ProductImportView
+
+
+class ProductAPITestCase(APITestCase):
+    """
+    Starts from an empty response cache. Product writes bump the cache
+    versions on commit, which never comes inside a TestCase: wrap writes
+    whose invalidation is under test in captureOnCommitCallbacks(execute=True).
+    """
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+
+class ProductCatalogTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.client.force_authenticate(self.seller)
+        Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10 + i, stock=5, user=self.seller)
+            for i in range(7)
+        ])
+
+    def test_catalog_is_cursor_paginated(self):
+        seen = []
+        url = '/api/product/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 7)
+
+    def test_catalog_skips_soft_deleted_products(self):
+        Products.objects.first().delete()
+        response = self.client.get('/api/product/')
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/product/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_catalog_streams_ndjson(self):
+        response = self.client.get('/api/product/?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['store_owner'], 'seller')
+
+
+class CatalogQueryCountTests(ProductAPITestCase):
+    """Listing endpoints must not issue a query per product"""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.seller.userprofile.role = 'seller'
+        self.seller.userprofile.is_seller_approved = True
+        self.seller.userprofile.save()
+        self.client.force_authenticate(self.seller)
+
+    def add_products(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            Products.objects.bulk_create([
+                Products(name=f'Product {i}', price=10, stock=5, user=self.seller)
+                for i in range(count)
+            ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_endpoints_run_constant_queries(self):
+        urls = ['/api/product/', '/api/product/?stream=ndjson', '/api/auth/seller/products/']
+        self.add_products(2)
+        baseline = {url: self.count_queries(url) for url in urls}
+        self.add_products(20)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), baseline[url])
+
+    def test_catalog_list_is_a_single_query(self):
+        self.add_products(5)
+        with self.assertNumQueries(1):
+            self.client.get('/api/product/')
+
+    def test_product_detail_is_a_single_query(self):
+        self.add_products(1)
+        product = Products.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/product/{product.id}/')
+        self.assertEqual(response.data['store_owner'], 'seller')
+
+
+class ProductSearchTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(self.seller)
+        self.mango = Products.objects.create(name='Green Mango', description='Sweet fruit', price=50, stock=5, user=self.seller)
+        self.apple = Products.objects.create(name='Apple', description='Mango flavoured', price=20, stock=5, user=self.seller)
+        self.mangosteen = Products.objects.create(name='Mangosteen', description='Purple', price=90, stock=0,
+                                                  status=Products.StatusofProduct.OUT_OF_STOCK, user=self.other)
+        Products.objects.create(name='Banana', description='Yellow', price=10, stock=5, user=self.seller)
+
+    def names(self, query):
+        response = self.client.get('/api/product/search/', query)
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def test_prefix_matches_ranked_by_name_first(self):
+        with self.assertNumQueries(1):
+            names = self.names({'q': 'man'})
+        self.assertEqual(set(names[:2]), {'Green Mango', 'Mangosteen'})
+        self.assertEqual(names[2], 'Apple')
+        self.assertEqual(self.names({'q': 'GREEN man'}), ['Green Mango'])
+        self.assertEqual(self.names({'q': 'manzana'}), [])
+        # FTS5 syntax in the input is taken as plain words
+        self.assertEqual(self.names({'q': 'mango OR "banana'}), [])
+
+    def test_filters(self):
+        self.assertEqual(set(self.names({'q': 'man', 'max_price': '60'})), {'Green Mango', 'Apple'})
+        self.assertEqual(self.names({'q': 'man', 'status': 'Out of Stocks'}), ['Mangosteen'])
+        self.assertEqual(self.names({'q': 'man', 'seller': self.other.id}), ['Mangosteen'])
+        self.assertEqual(self.client.get('/api/product/search/', {'q': 'man', 'min_price': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/product/search/').status_code, 400)
+
+    def test_index_follows_writes(self):
+        self.mango.name = 'Ripe Papaya'
+        self.mango.save()
+        Products.objects.filter(pk=self.apple.pk).update(description='Crunchy')
+        self.mangosteen.delete()
+        self.assertEqual(self.names({'q': 'man'}), [])
+        self.assertEqual(self.names({'q': 'papa'}), ['Ripe Papaya'])
+        Products.objects.filter(pk=self.mango.pk).delete()
+        self.assertEqual(self.names({'q': 'papa'}), [])
+
+    def test_cursor_pagination(self):
+        first = self.client.get('/api/product/search/', {'q': 'man', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(second.data['next'])
+        names = [product['name'] for product in first.data['results'] + second.data['results']]
+        self.assertEqual(names[2], 'Apple')
+        self.assertEqual(len(set(names)), 3)
+
+    def test_scan_fallback_finds_the_same_products(self):
+        products = Products.catalog.all()
+        for query in ('man', 'green man', 'yel', 'zzz'):
+            self.assertEqual(
+                set(search.search(products, query, engine='scan')),
+                set(search.search(products, query, engine='fts')),
+            )
+
+
+class ProductFacetTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(self.seller)
+        self.cheap = Products.objects.create(name='Banana', price=20, stock=5, user=self.seller)
+        self.mid = Products.objects.create(name='Avocado', price=150, stock=1, user=self.seller)
+        self.dear = Products.objects.create(name='Durian', price=900, stock=0,
+                                            status=Products.StatusofProduct.OUT_OF_STOCK, user=self.other)
+
+    def names(self, query):
+        response = self.client.get('/api/product/', query)
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def assertCountsMatchProducts(self):
+        stored = {
+            (dimension, value): count
+            for dimension, values in ProductFacetCount.counts().items() for value, count in values.items()
+        }
+        self.assertEqual(stored, dict(facets.count(Products.objects.all())))
+
+    def test_filters_and_orderings(self):
+        self.assertEqual(self.names({'ordering': 'price'}), ['Banana', 'Avocado', 'Durian'])
+        self.assertEqual(self.names({'ordering': '-price', 'max_price': '500'}), ['Avocado', 'Banana'])
+        self.assertEqual(self.names({'ordering': 'name', 'seller': self.seller.id}), ['Avocado', 'Banana'])
+        self.assertEqual(self.names({'status': 'Out of Stocks'}), ['Durian'])
+        today = timezone.localdate().isoformat()
+        self.assertEqual(len(self.names({'created_after': today, 'created_before': today})), 3)
+        self.assertEqual(self.client.get('/api/product/', {'ordering': 'stock'}).status_code, 400)
+
+    def test_cursor_follows_the_ordering(self):
+        first = self.client.get('/api/product/', {'ordering': '-price', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['name'] for row in first.data['results'] + second.data['results']],
+                         ['Durian', 'Avocado', 'Banana'])
+        self.assertIsNone(second.data['next'])
+
+    def test_facets_are_read_from_the_stored_counts(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/product/', {'facets': '1'})
+        self.assertEqual(response.data['facets']['status'], {'Available': 2, 'Out of Stocks': 1})
+        self.assertEqual(response.data['facets']['seller'], {str(self.seller.id): 2, str(self.other.id): 1})
+        self.assertEqual(response.data['facets']['price'], {'0-100': 1, '100-500': 1, '500-1000': 1})
+        self.assertNotIn('facets', self.client.get('/api/product/').data)
+
+    def test_counts_follow_writes(self):
+        self.assertCountsMatchProducts()
+        Products.objects.filter(pk=self.mid.pk).reserve_stock(1)
+        self.cheap.price = 2000
+        self.cheap.save()
+        self.dear.delete()
+        self.assertCountsMatchProducts()
+        self.dear.restore()
+        Products.objects.filter(user=self.seller).update(user=self.other)
+        Products.objects.bulk_create([Products(name='Okra', price=5, stock=1, user=self.seller)])
+        self.assertCountsMatchProducts()
+        Products.objects.filter(pk=self.mid.pk).delete()
+        Products.catalog.get(pk=self.cheap.pk).delete()
+        self.assertCountsMatchProducts()
+        self.assertEqual(ProductFacetCount.counts()['status'], {'Available': 1, 'Out of Stocks': 1})
+
+    def test_counts_follow_queryset_updates(self):
+        # Updates of the columns they filter on, and SET expressions
+        Products.objects.filter(status=Products.StatusofProduct.AVAILABLE, price__lt=100).set_stock(0)
+        Products.objects.filter(price__lt=1000).update(price=F('price') * 10)
+        Products.objects.filter(user=self.seller).soft_delete()
+        self.assertCountsMatchProducts()
+        Products.all_objects.filter(user=self.seller).restore()
+        Products.objects.filter(stock=0).restock(2)
+        self.assertCountsMatchProducts()
+
+    def test_rebuild(self):
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.rebuild()
+        self.assertCountsMatchProducts()
+
+
+class SoftDeleteTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.client.force_authenticate(self.seller)
+        self.products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10, stock=5, user=self.seller) for i in range(4)
+        ])
+
+    def test_default_manager_hides_soft_deleted_products(self):
+        self.products[0].delete()
+        self.assertEqual(Products.objects.count(), 3)
+        self.assertEqual(self.seller.products.count(), 3)
+        self.assertEqual(Products.all_objects.count(), 4)
+        self.assertFalse(Products.objects.filter(pk=self.products[0].pk).exists())
+        # Related objects still reach it
+        item = OrderItem.objects.create(product=self.products[0], quantity=1)
+        self.assertEqual(OrderItem.objects.get(pk=item.pk).product, self.products[0])
+
+    def test_queryset_soft_delete_and_restore_are_one_update(self):
+        pks = [product.pk for product in self.products[:3]]
+        # One GROUP BY per facet dimension, the UPDATE and one UPDATE per changed facet count
+        with self.assertNumQueries(9):
+            self.assertEqual(Products.objects.filter(pk__in=pks).soft_delete(), 3)
+        self.assertEqual(Products.objects.count(), 1)
+        self.assertEqual(Products.objects.filter(pk__in=pks).soft_delete(), 0)
+
+        with self.assertNumQueries(9):
+            self.assertEqual(Products.all_objects.filter(pk__in=pks[:2]).restore(), 2)
+        self.assertEqual(Products.objects.count(), 3)
+        with self.assertRaises(AttributeError):
+            Products.objects.soft_delete()
+
+    def test_delete_endpoint(self):
+        url = f'/api/product/{self.products[0].id}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertIsNotNone(Products.all_objects.get(pk=self.products[0].pk).deleted_at)
+
+    def test_soft_deleted_products_cannot_be_ordered(self):
+        self.products[0].delete()
+        with self.assertRaises(OrderPlacementError):
+            place_order(self.seller, 'Cash on Delivery', [{'product_id': self.products[0].id, 'quantity': 1}])
+
+
+class ProductResponseCacheTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.client.force_authenticate(self.seller)
+        self.product = Products.objects.create(name='Mango', price=10, stock=5, user=self.seller)
+        self.other = Products.objects.create(name='Apple', price=5, stock=5, user=self.seller)
+
+    def test_repeated_requests_are_served_from_the_cache(self):
+        for url in ['/api/product/', f'/api/product/{self.product.id}/']:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(second.data, first.data)
+                self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_304(self):
+        etag = self.client.get(f'/api/product/{self.product.id}/')['ETag']
+        response = self.client.get(f'/api/product/{self.product.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_saving_a_product_invalidates_it_and_the_catalog(self):
+        detail = f'/api/product/{self.product.id}/'
+        other_detail = f'/api/product/{self.other.id}/'
+        etag = self.client.get(detail)['ETag']
+        self.client.get('/api/product/')
+        self.client.get(other_detail)
+
+        self.product.price = 12
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['price'], '12.00')
+        prices = {row['id']: row['price'] for row in self.client.get('/api/product/').data['results']}
+        self.assertEqual(prices[self.product.id], '12.00')
+        # Other products keep their cached entry
+        with self.assertNumQueries(0):
+            self.client.get(other_detail)
+
+    def test_soft_delete_and_restore_invalidate(self):
+        detail = f'/api/product/{self.product.id}/'
+        self.client.get(detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get(detail).status_code, 404)
+        self.assertEqual(len(self.client.get('/api/product/').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.restore()
+        self.assertEqual(self.client.get(detail).status_code, 200)
+
+    def test_stock_updates_invalidate(self):
+        detail = f'/api/product/{self.product.id}/'
+        self.client.get(detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            Products.objects.filter(pk=self.product.pk).reserve_stock(5)
+        response = self.client.get(detail)
+        self.assertEqual(response.data['stock'], 0)
+        self.assertEqual(response.data['status'], Products.StatusofProduct.OUT_OF_STOCK)
+
+
+    def test_queryset_updates_bump_one_generation_on_commit(self):
+        detail = f'/api/product/{self.product.id}/'
+        other_detail = f'/api/product/{self.other.id}/'
+        self.client.get(detail)
+        self.client.get(other_detail)
+        with mock.patch('products.cache.cache.set_many', wraps=cache.set_many) as set_many:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                Products.objects.filter(user=self.seller).restock(3)
+                # Nothing is written while the transaction holds the write lock
+                set_many.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(set(set_many.call_args.args[0]), {CATALOG_VERSION_KEY, GENERATION_KEY})
+        self.assertEqual(self.client.get(detail).data['stock'], 8)
+        self.assertEqual(self.client.get(other_detail).data['stock'], 8)
+
+class OrderPlacementTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.client.force_authenticate(self.customer)
+        self.products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10, stock=5, user=self.seller)
+            for i in range(10)
+        ])
+
+    def place(self, items):
+        return self.client.post('/api/orders/', {
+            'card_number': '1234567890123456',
+            'items': items,
+        }, format='json')
+
+    def test_order_takes_stock_and_flags_discount_day(self):
+        DiscountDay.objects.create(seller=self.seller, date=timezone.localdate(), discount_percentage=10)
+        product = self.products[0]
+        response = self.place([{'product_id': product.id, 'quantity': 2}, {'product_id': product.id, 'quantity': 3}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['order_items']), 2)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.status, Products.StatusofProduct.OUT_OF_STOCK)
+        self.assertTrue(all(item.is_discount_day for item in OrderItem.objects.all()))
+
+    def test_items_keep_the_price_and_discount_they_were_sold_at(self):
+        DiscountDay.objects.create(seller=self.seller, date=timezone.localdate(), discount_percentage=20)
+        product = self.products[0]
+        self.place([{'product_id': product.id, 'quantity': 2}])
+        Products.objects.filter(pk=product.pk).update(price=99)
+        DiscountDay.objects.all().delete()
+
+        item = OrderItem.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(item.original_sub_total, 20)
+            self.assertEqual(item.discount_amount, 4)
+            self.assertEqual(item.final_sub_total, 16)
+
+    def test_insufficient_stock_rolls_back_the_order(self):
+        response = self.place([
+            {'product_id': self.products[0].id, 'quantity': 1},
+            {'product_id': self.products[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 5)
+
+    def test_unknown_product_is_rejected(self):
+        response = self.place([{'product_id': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_queries_do_not_grow_with_cart_lines(self):
+        def count(product, lines):
+            with CaptureQueriesContext(connection) as context:
+                response = self.place([{'product_id': product.id, 'quantity': 1}] * lines)
+            self.assertEqual(response.status_code, 201)
+            return len(context.captured_queries)
+
+        # The first order of the day also creates the seller's daily sales row
+        count(self.products[0], 1)
+        self.assertEqual(count(self.products[1], 1), count(self.products[2], 4))
+
+    def test_stock_reservation_queries(self):
+        place_order(self.customer, 'Cash on Delivery', [{'product_id': self.products[0].id}])
+        items = [{'product_id': self.products[1].id, 'quantity': 2}, {'product_id': self.products[2].id}]
+        # Savepoint, products, order, discount days, items, daily sales, inbox links, item links,
+        # per product a locking read and the UPDATE, prefetched items, release
+        with self.assertNumQueries(14):
+            place_order(self.customer, 'Cash on Delivery', items)
+        # Selling out moves the product to the out of stock facet, creating its count row here
+        with self.assertNumQueries(17):
+            place_order(self.customer, 'Cash on Delivery', [{'product_id': self.products[1].id, 'quantity': 3}])
+        self.assertEqual(ProductFacetCount.counts()['status'], {'Available': 9, 'Out of Stocks': 1})
+
+
+class CustomerOrderHistoryTests(APITestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', password='pass')
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.client.force_authenticate(self.customer)
+        products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10, stock=1000, user=seller) for i in range(5)
+        ])
+        self.orders = [
+            place_order(self.customer, 'Cash on Delivery', [
+                {'product_id': product.id, 'quantity': 2} for product in products[:n % 5 + 1]
+            ])
+            for n in range(25)
+        ]
+
+    def test_history_pages_cost_the_same_queries(self):
+        # the page of orders, then the items of all of them
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/orders/?page_size=10')
+        with self.assertNumQueries(2):
+            second = self.client.get(first.data['next'])
+        with self.assertNumQueries(2):
+            last = self.client.get(second.data['next'])
+        self.assertIsNone(last.data['next'])
+
+        orders = first.data['results'] + second.data['results'] + last.data['results']
+        self.assertEqual([order['number'] for order in orders], [str(o.number) for o in reversed(self.orders)])
+        self.assertEqual(len(orders[0]['order_items']), 5)
+        self.assertEqual(orders[0]['order_items'][0]['sub_total'], Decimal('20.00'))
+
+    def test_orders_placed_in_the_same_millisecond_are_not_skipped(self):
+        created_at = timezone.now().replace(microsecond=123000)
+        for n, order in enumerate(self.orders[:6]):
+            Order.objects.filter(pk=order.pk).update(created_at=created_at + datetime.timedelta(microseconds=n * 100))
+        numbers = []
+        url = '/api/orders/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            numbers += [order['number'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(numbers), sorted(str(order.number) for order in self.orders))
+
+    def test_single_order_prefetches_its_items(self):
+        order = self.orders[4]
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/orders/{order.number}/')
+        self.assertEqual(len(response.data['order_items']), 5)
+
+
+class StockReservationTests(TransactionTestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+
+    def test_reserve_stock_takes_the_last_unit_and_marks_out_of_stock(self):
+        product = Products.objects.create(name='Hot', price=10, stock=2, user=self.seller)
+        products = Products.objects.filter(pk=product.pk)
+        self.assertEqual(products.reserve_stock(3), 0)
+        self.assertEqual(products.reserve_stock(2), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.status, Products.StatusofProduct.OUT_OF_STOCK)
+
+    def test_concurrent_reservations_never_oversell(self):
+        stock, buyers = 25, 60
+        product = Products.objects.create(name='Hot', price=10, stock=stock, user=self.seller)
+        start = threading.Barrier(buyers)
+        results = []
+
+        def buy():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        results.append(Products.objects.filter(pk=product.pk).reserve_stock(1))
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting, back off before retrying
+                        time.sleep(random.random() / 100)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(sum(results), stock)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.status, Products.StatusofProduct.OUT_OF_STOCK)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        stock, buyers = 8, 20
+        product = Products.objects.create(name='Hot', price=10, stock=stock, user=self.seller)
+        customer = User.objects.create_user(username='customer', password='pass')
+        start = threading.Barrier(buyers)
+        placed, rejected = [], []
+
+        def checkout():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        placed.append(place_order(customer, 'Cash on Delivery', [{'product_id': product.pk}]))
+                        return
+                    except OrderPlacementError:
+                        rejected.append(True)
+                        return
+                    except OperationalError:
+                        # Every writer may have been refused at once, back off before retrying
+                        time.sleep(random.random() / 100)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(placed), stock)
+        self.assertEqual(len(rejected), buyers - stock)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), stock)
+        self.assertEqual(OrderItem.objects.count(), stock)
+
+
+class ProductImportExportTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.seller.userprofile.role = 'seller'
+        self.seller.userprofile.is_seller_approved = True
+        self.seller.userprofile.save()
+        self.client.force_authenticate(self.seller)
+        self.existing = Products.objects.create(name='Mango', price=10, stock=5, user=self.seller)
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post('/api/product/import/', {'file': upload, **params}, format='multipart')
+
+    def test_csv_import_upserts_and_reports_bad_rows(self):
+        response = self.upload('products.csv', (
+            'id,name,description,price,stock\n'
+            f'{self.existing.id},Mango,Sweet,12.50,0\n'
+            ',Apple,,3.00,10\n'
+            ',Banana,,-1,10\n'
+            ',Apple,Red,3.50,4\n'
+            '999999,Ghost,,1,1\n'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 6])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, Decimal('12.50'))
+        self.assertEqual(self.existing.status, Products.StatusofProduct.OUT_OF_STOCK)
+        apple = Products.objects.get(name='Apple')
+        self.assertEqual((apple.description, apple.stock, apple.user), ('Red', 4, self.seller))
+
+    def test_ndjson_import_in_chunks(self):
+        lines = [json.dumps({'name': f'Product {i}', 'price': '1.00', 'stock': i}) for i in range(25)]
+        lines.insert(3, 'not json')
+        with mock.patch.object(ProductImportView, 'import_chunk_size', 10):
+            with CaptureQueriesContext(connection) as context:
+                response = self.upload('products.ndjson', '\n'.join(lines))
+        self.assertEqual(response.data['created'], 25)
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+        self.assertLess(len(context.captured_queries), 30)
+
+    def test_imported_text_is_normalized_like_the_api(self):
+        self.upload('products.csv', 'name,description,price,stock\n"  green   apple ",crisp  and sour,3,1\n')
+        apple = Products.objects.get(user=self.seller, name='Green Apple')
+        self.assertEqual(apple.description, 'Crisp And Sour')
+        # The same name typed differently updates that product
+        result = self.upload('products.csv', 'name,price,stock\nGREEN apple,4,1\n').data
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+
+    def test_unreadable_line_stops_the_import_and_reports_what_landed(self):
+        # Longer than the block the file is decoded in, so the bad byte is not met at once
+        lines = [json.dumps({'name': f'Product {i}', 'price': '1.00', 'stock': 1}) for i in range(400)]
+        content = '\n'.join(lines).encode() + b'\n{"name": "Caf\xe9", "price": "1.00", "stock": 1}\n'
+        upload = SimpleUploadedFile('products.ndjson', content)
+        with mock.patch.object(ProductImportView, 'import_chunk_size', 10):
+            response = self.client.post('/api/product/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        created = response.data['created']
+        self.assertGreater(created, 10)
+        self.assertEqual(response.data['stopped_at_line'], created + 1)
+        self.assertEqual(response.data['errors'][-1]['line'], created + 1)
+        # Mango was there before
+        self.assertEqual(Products.objects.filter(user=self.seller).count(), created + 1)
+
+    def test_only_approved_sellers_can_import(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        self.client.force_authenticate(customer)
+        self.assertEqual(self.upload('products.csv', 'name,price,stock\nA,1,1\n').status_code, 403)
+
+    def test_export_round_trips_through_import(self):
+        Products.objects.create(name='Apple', price=3, stock=0, user=self.seller)
+        other = User.objects.create_user(username='other', password='pass')
+        Products.objects.create(name='Not mine', price=3, stock=0, user=other)
+
+        for file_format in ('csv', 'ndjson'):
+            with self.subTest(file_format=file_format):
+                response = self.client.get(f'/api/product/export/?type={file_format}')
+                self.assertTrue(response.streaming)
+                content = b''.join(response.streaming_content).decode()
+                self.assertNotIn('Not mine', content)
+                result = self.upload(f'products.{file_format}', content).data
+                self.assertEqual((result['created'], result['updated'], result['errors']), (0, 2, []))
+
+
+@override_settings(PRODUCT_IMAGE_WORKERS=0)
+class ProductImageVariantTests(ProductAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage_settings = override_settings(MEDIA_ROOT=media_root)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.seller.userprofile.role = 'seller'
+        self.seller.userprofile.is_seller_approved = True
+        self.seller.userprofile.save()
+        self.client.force_authenticate(self.seller)
+
+    def photo(self, size=(3000, 2000)):
+        image = Image.new('RGB', size, (200, 120, 40))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        output = io.BytesIO()
+        image.save(output, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def create_product(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/product/', {'name': 'mango', 'price': '10', 'stock': 5, 'image': self.photo()},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        return Products.objects.get(pk=response.data['id'])
+
+    def test_upload_builds_resized_variants_without_metadata(self):
+        product = self.create_product()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+        for name, box in VARIANTS.items():
+            for extension in FORMATS:
+                with default_storage.open(product.image_variants[name][extension]) as variant:
+                    image = Image.open(variant)
+                    # 3:2 photo, the width hits the bounding box
+                    self.assertEqual(image.width, box[0])
+                    self.assertLessEqual(image.height, box[1])
+                    self.assertEqual(len(image.getexif()), 0)
+
+        response = self.client.get(f'/api/product/{product.id}/')
+        self.assertTrue(response.data['image_variants']['thumb']['webp'].endswith('/thumb.webp'))
+
+    @override_settings(PRODUCT_IMAGE_MAX_PIXELS=2_000_000)
+    def test_images_too_large_to_decode_get_no_variants(self):
+        output = io.BytesIO()
+        Image.new('RGB', (2000, 1500), (200, 120, 40)).save(output, 'PNG')
+        with self.assertRaises(ImageTooLarge):
+            next(render_variants(io.BytesIO(output.getvalue())))
+
+        png = SimpleUploadedFile('photo.png', output.getvalue(), content_type='image/png')
+        with self.assertLogs('products.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/product/', {'name': 'mango', 'price': '10', 'stock': 5, 'image': png}, format='multipart',
+            )
+        product = Products.objects.get(pk=response.data['id'])
+        self.assertEqual(product.image_variants, {'source': product.image.name})
+        self.assertEqual(response.data['image_variants'], {})
+
+        # A larger JPEG is decoded at a reduced scale, which stays under the limit
+        self.assertIn('thumb', self.create_product().image_variants)
+
+    def test_removing_the_image_removes_the_variants(self):
+        product = self.create_product()
+        thumb = product.image_variants['thumb']['jpeg']
+        product.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {'source': None})
+        self.assertFalse(default_storage.exists(thumb))
+
+
+class ArchivalTests(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10, stock=50, user=self.seller) for i in range(3)
+        ])
+        self.old = place_order(self.customer, 'Cash on Delivery', [{'product_id': self.products[0].id, 'quantity': 2}])
+        self.recent = place_order(self.customer, 'G-Cash', [{'product_id': self.products[1].id, 'quantity': 1}])
+        Order.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - datetime.timedelta(days=800))
+        long_ago = timezone.now() - datetime.timedelta(days=60)
+        Products.objects.filter(pk__in=[self.products[0].pk, self.products[2].pk]).update(deleted_at=long_ago)
+
+    def read_archive(self, kind):
+        path = Path(self.directory) / f'{kind}-{timezone.now():%Y%m%d}.ndjson.gz'
+        with gzip.open(path, 'rt') as archive_file:
+            return [json.loads(line) for line in archive_file]
+
+    def test_archives_old_orders_then_purges_products_without_items(self):
+        sales = list(SellerDailySales.objects.values_list('item_count', 'net_revenue'))
+        totals = archival.archive(directory=self.directory, batch_size=1)
+        self.assertEqual(totals, {'orders': 1, 'order_items': 1, 'products': 2})
+
+        self.assertEqual(list(Order.objects.all()), [self.recent])
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertFalse(SellerOrder.objects.filter(order_id=self.old.pk).exists())
+        self.assertEqual(Products.all_objects.count(), 1)
+        # Seller stats still count the archived order
+        self.assertEqual(list(SellerDailySales.objects.values_list('item_count', 'net_revenue')), sales)
+
+        [order] = self.read_archive('orders')
+        self.assertEqual(order['number'], str(self.old.pk))
+        self.assertEqual(order['items'][0]['quantity'], 2)
+        self.assertEqual({row['id'] for row in self.read_archive('products')},
+                         {self.products[0].pk, self.products[2].pk})
+
+    def test_products_with_order_items_wait_for_their_orders(self):
+        totals = archival.archive(directory=self.directory, order_days=1000)
+        self.assertEqual(totals, {'products': 1})
+        self.assertTrue(Products.all_objects.filter(pk=self.products[0].pk).exists())
+
+    def test_an_interrupted_batch_is_finished_first(self):
+        with mock.patch.object(archival, '_delete', side_effect=OSError):
+            with self.assertRaises(OSError):
+                archival.archive(directory=self.directory)
+        self.assertTrue(Order.objects.filter(pk=self.old.pk).exists())
+
+        totals = archival.archive(directory=self.directory)
+        self.assertEqual(totals, {'orders': 1, 'order_items': 1, 'products': 2})
+        # The order went into the archive once
+        self.assertEqual(len(self.read_archive('orders')), 1)
+
+    def test_a_torn_archive_write_is_cut_off(self):
+        def torn_append(path, records):
+            with open(path, 'ab') as raw:
+                raw.write(gzip.compress(b'{"half": ')[:12])
+            raise OSError
+
+        with mock.patch.object(archival, '_append', side_effect=torn_append):
+            with self.assertRaises(OSError):
+                archival.archive(directory=self.directory)
+
+        archival.archive(directory=self.directory)
+        self.assertEqual([order['number'] for order in self.read_archive('orders')], [str(self.old.pk)])
+
+    def test_concurrent_runs_are_refused(self):
+        # Another process holding the lock, flock locks of separate open files conflict
+        with open(Path(self.directory) / archival.LOCK_FILE, 'w') as lock_file:
+            archival.fcntl.flock(lock_file, archival.fcntl.LOCK_EX)
+            with self.assertRaises(archival.ArchivalError):
+                archival.archive(directory=self.directory)
+        self.assertEqual(archival.archive(directory=self.directory)['orders'], 1)
+
+
+class AsyncEndpointTests(ProductAPITestCase):
+    """The /api/async/ views answer like their DRF counterparts"""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.products = Products.objects.bulk_create([
+            Products(name=f'Product {i}', price=10 + i, stock=5, user=self.seller) for i in range(5)
+        ])
+        for product in self.products[:3]:
+            place_order(self.customer, 'Cash on Delivery', [{'product_id': product.id, 'quantity': 1}])
+        self.auth = {'Authorization': f"Bearer {get_tokens_for_user(self.customer)['access']}"}
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth['Authorization'])
+
+    async def get(self, url, **params):
+        return await self.async_client.get(url, params, headers=self.auth)
+
+    async def test_bodies_match_the_sync_endpoints(self):
+        pairs = [
+            ('/api/product/', '/api/async/product/', {'ordering': 'price', 'page_size': 2, 'facets': '1'}),
+            ('/api/product/', '/api/async/product/', {'max_price': '12', 'ordering': '-price'}),
+            (f'/api/product/{self.products[0].id}/', f'/api/async/product/{self.products[0].id}/', {}),
+            ('/api/orders/', '/api/async/orders/', {'page_size': 2}),
+        ]
+        for sync_url, async_url, params in pairs:
+            with self.subTest(url=async_url, params=params):
+                expected = await sync_to_async(self.client.get)(sync_url, params)
+                response = await self.get(async_url, **params)
+                self.assertEqual(response.status_code, 200)
+                body = response.json()
+                if body.get('next'):
+                    # Same cursor, different path
+                    self.assertEqual(body['next'].split('cursor=')[1], expected.data['next'].split('cursor=')[1])
+                    body['next'] = expected.data['next']
+                self.assertEqual(body, json.loads(expected.content))
+
+    async def test_deactivated_and_deleted_users_are_turned_away(self):
+        self.customer.is_active = False
+        await self.customer.asave()
+        response = await self.get('/api/async/orders/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'user_inactive')
+
+        await self.customer.adelete()
+        response = await self.get('/api/async/orders/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'user_not_found')
+
+    async def test_order_history_pages_and_count(self):
+        response = await self.get('/api/async/orders/', page_size=2)
+        self.assertEqual(response['X-Total-Count'], '3')
+        following = await self.async_client.get(response.json()['next'], headers=self.auth)
+        self.assertEqual(len(following.json()['results']), 1)
+        self.assertIsNone(following.json()['next'])
+
+    def test_token_is_enough(self):
+        # Product page and facets, no user or profile query
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/async/product/', {'facets': '1'})
+        self.assertEqual(len(response.json()['results']), 5)
+
+    async def test_errors(self):
+        self.assertEqual((await self.async_client.get('/api/async/orders/')).status_code, 401)
+        bad_token = await self.async_client.get('/api/async/orders/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(bad_token.status_code, 401)
+        self.assertEqual((await self.get('/api/async/product/', ordering='stock')).status_code, 400)
+        self.assertEqual((await self.get('/api/async/product/', cursor='nope')).status_code, 404)
+        self.assertEqual((await self.get('/api/async/product/999999/')).status_code, 404)
+        self.assertEqual((await self.async_client.post('/api/async/product/', headers=self.auth)).status_code, 405)
@@ -1,17 +1,32 @@
+import json
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Sum, Count
-from django.utils import timezone
+from django.http import StreamingHttpResponse
 from datetime import datetime
-from .serializers import ProductSerializer, OrderSerializer, PaymentSerializer
-from .models import Products, Order, OrderItem
+from clients.authentication import get_profile_info
+from core.asyncapi import async_api_view, json_response
+from core.routers import ReplicaReadMixin
+from . import bulk, cache as product_cache, search
+from .serializers import (
+    ProductSerializer, ProductListQuerySerializer, ProductSearchQuerySerializer, OrderSerializer, PaymentSerializer,
+    sanitize_product_text,
+)
+from .models import Products, ProductFacetCount, Order
+from .pagination import CATALOG_ORDERINGS, OrderPagination, ProductCursorPagination, ProductSearchPagination
+from .services import OrderPlacementError, delete_order, place_order
 
 
 # Create your views here.
-class ProductView(APIView):
+class ProductView(ReplicaReadMixin, APIView):
+    pagination_class = ProductCursorPagination
+    stream_chunk_size = 2000
+
     def sanitizer(self, value):
         """Sanitize string values by removing extra whitespace"""
         if not isinstance(value, str):
@@ -25,30 +40,19 @@ class ProductView(APIView):
 
     def post(self, request):
         # Check if user is an approved seller (replicating IsSeller logic)
-        try:
-            profile = request.user.userprofile
-            is_approved_seller = profile.role == 'seller' and profile.is_seller_approved
-        except:
-            is_approved_seller = False
+        profile = get_profile_info(request.user)
+        is_approved_seller = profile is not None and profile.role == 'seller' and profile.is_seller_approved
 
         if not is_approved_seller:
             return Response({'error': 'Only approved sellers can create products'}, status=status.HTTP_403_FORBIDDEN)
 
-        def sanitizer(value):
-            if not isinstance(value, str):
-                raise TypeError("Input must be a string")
-
-            # Replace multiple spaces with a single space
-            value = " ".join(value.split())
-
-            return value.title().strip()
-
-        data = request.data.copy()
+        # QueryDict.copy() deep copies uploads, large images are temporary files that cannot be copied
+        data = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
 
         if 'name' in data and isinstance(data['name'], str):
-            data['name'] = sanitizer(data['name'])
+            data['name'] = sanitize_product_text(data['name'])
         if 'description' in data and isinstance(data['description'], str):
-            data['description'] = sanitizer(data['description'])
+            data['description'] = sanitize_product_text(data['description'])
 
         serializer = ProductSerializer(data=data)
 
@@ -60,27 +64,77 @@ class ProductView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
-        # Only return non-deleted products
-        products = Products.objects.filter(deleted_at__isnull=True)
-        view = ProductSerializer(products, many=True)
-        return Response(view.data)
+        """
+        ?min_price=&max_price=&status=&seller=&created_after=&created_before= filter,
+        ?ordering= is one of CATALOG_ORDERINGS and ?facets=1 adds the catalog facet counts
+        """
+        params = ProductListQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ordering = CATALOG_ORDERINGS[params.validated_data['ordering']]
+        # The catalog manager leaves soft deleted products out
+        products = Products.catalog.filter(**params.filters())
+
+        # ?stream=ndjson streams the whole catalog one product per line
+        if request.query_params.get('stream') == 'ndjson':
+            return self.stream_ndjson(products, ordering)
+
+        def build():
+            paginator = self.pagination_class()
+            paginator.ordering = ordering
+            page = paginator.paginate_queryset(products, request, view=self)
+            view = ProductSerializer(page, many=True)
+            response = paginator.get_paginated_response(view.data)
+            if params.validated_data['facets']:
+                response.data['facets'] = ProductFacetCount.counts()
+            return response
+
+        return product_cache.cached_response(request, product_cache.catalog_key(request), build)
+
+    def stream_ndjson(self, products, ordering):
+        """Serialize products chunk by chunk so memory stays flat for any catalog size"""
+        products = products.order_by(*ordering)
+        serializer = ProductSerializer()
+
+        def rows():
+            for product in products.iterator(chunk_size=self.stream_chunk_size):
+                yield json.dumps(serializer.to_representation(product), cls=DjangoJSONEncoder) + '\n'
+
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+class ProductSearchView(ReplicaReadMixin, APIView):
+    """
+    GET /api/product/search/?q=ripe man&min_price=&max_price=&status=&seller=
+    Every word must match the start of a word in the name or description.
+    """
+    pagination_class = ProductSearchPagination
+
+    def get(self, request):
+        params = ProductSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        products = Products.catalog.filter(**params.filters())
+        products = search.search(products, params.validated_data['q'])
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        return paginator.get_paginated_response(ProductSerializer(page, many=True).data)
 
 
 class ProductRetriveUpdateDelete(APIView):
     def get(self, request, pk):
-        try:
-            # Only return non-deleted products
-            product = Products.objects.filter(id=pk, deleted_at__isnull=True).first()
+        def build():
+            product = Products.catalog.filter(id=pk).first()
             if product is None:
                 return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
             serializer = ProductSerializer(product)
             return Response(serializer.data)
-        except Products.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return product_cache.cached_response(request, product_cache.product_key(request, pk), build)
 
     def put(self, request, pk):
         try:
-            product = Products.objects.filter(id=pk, deleted_at__isnull=True).first()
+            product = Products.catalog.filter(id=pk).first()
             if product is None:
                 return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -101,7 +155,7 @@ class ProductRetriveUpdateDelete(APIView):
 
     def patch(self, request, pk):
         try:
-            product = Products.objects.filter(id=pk, deleted_at__isnull=True).first()
+            product = Products.catalog.filter(id=pk).first()
             if product is None:
                 return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -122,13 +176,54 @@ class ProductRetriveUpdateDelete(APIView):
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
     def delete(self, request, pk):
-        try:
-            product = Products.objects.get(id=pk)
-            # Perform soft delete
-            product.delete(soft=True)
-            return Response({'message': 'Product soft deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
-        except Products.DoesNotExist:
+        # Soft delete with a single UPDATE, a product that is already deleted is not found
+        if not Products.objects.filter(id=pk).soft_delete():
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'Product soft deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
+
+
+class ProductImportView(APIView):
+    """Upsert the seller's products from an uploaded CSV or NDJSON file (form field ``file``)"""
+    import_chunk_size = 1000
+
+    def post(self, request):
+        profile = get_profile_info(request.user)
+        if profile is None or profile.role != 'seller' or not profile.is_seller_approved:
+            return Response({'error': 'Only approved sellers can import products'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the products as a "file" field'}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.query_params.get('type') or bulk.format_from_name(upload.name)
+        try:
+            result = bulk.import_products(
+                request.user, bulk.read_rows(upload, file_format), chunk_size=self.import_chunk_size
+            )
+        except bulk.BulkImportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # The rows before an unreadable line are imported, the counts say how many
+        if result['stopped_at_line'] is not None:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+
+class ProductExportView(APIView):
+    """Stream the seller's live products as CSV (default) or NDJSON with ?type=ndjson"""
+    export_chunk_size = 2000
+
+    def get(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in bulk.FORMATS:
+            return Response({'error': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = Products.objects.filter(user=request.user)
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(
+            bulk.export_rows(products, file_format, chunk_size=self.export_chunk_size), content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
 
 
 class OrderView(APIView):
@@ -140,193 +235,48 @@ class OrderView(APIView):
         if card_number is None:
             return Response({'message': 'Please input Credit Card No'})
 
-        # Prepare order data (excluding items and card_number)
-        order_data = {
-            'user': request.user,
-            'payment': request.data.get('payment', 'Cash on Delivery'),  # Default payment method
-        }
-
-        # Create the order
-        order = Order.objects.create(**order_data)
-
-        # Handle items separately after order is created
-        items_data = request.data.get('items', [])
-        order_items = []
-        for item_data in items_data:
-            from .models import Products
-            # Get the product based on product_id from the request
-            product_id = item_data.get('product_id')
-            quantity_requested = item_data.get('quantity', 1)
-            if product_id:
-                try:
-                    product = Products.objects.get(id=product_id)
-                    # Check stock availability
-                    if product.stock < quantity_requested:
-                        # Rollback: delete the order since insufficient stock
-                        order.delete()
-                        return Response(
-                            {'error': f'Insufficient stock for {product.name}. Available: {product.stock}, Requested: {quantity_requested}'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-
-                    # Create order item
-                    order_item = OrderItem.objects.create(
-                        product=product,
-                        quantity=quantity_requested
-                    )
-                    order_items.append(order_item)
-
-                    # Decrease product stock
-                    product.stock -= quantity_requested
-                    if product.stock <= 0:
-                        product.status = product.StatusofProduct.OUT_OF_STOCK
-                    product.save()
-                except Products.DoesNotExist:
-                    # Rollback: delete the order since we can't create the items
-                    order.delete()
-                    return Response(
-                        {'error': f'Product with id {product_id} does not exist'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-        # Add order items to the order
-        order.order_item.set(order_items)
-
-        # Update order items for discount days
         try:
-            for item in order.order_item.all():
-                # Check if item has a valid product
-                if item.product and item.product.user:
-                    current_date = timezone.now().date()
-                    try:
-                        from discounts.models import DiscountDay
-                        discount_day = DiscountDay.objects.get(
-                            seller=item.product.user,
-                            date=current_date,
-                            is_active=True
-                        )
-                        item.is_discount_day = True
-                        item.save()
-                    except DiscountDay.DoesNotExist:
-                        item.is_discount_day = False
-                        item.save()
-        except Exception as e:
-            # Log the error but don't fail the order
-            print(f"Error updating discount days: {e}")
-            pass  # Continue with the order even if discount update fails
+            order = place_order(
+                request.user,
+                request.data.get('payment', 'Cash on Delivery'),  # Default payment method
+                request.data.get('items', []),
+            )
+        except OrderPlacementError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Serialize the created order for response
         response_serializer = OrderSerializer(order)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
-class CustomerOrderView(APIView):
-    permission_classes = [IsAuthenticated]
+class CustomerOrderView(OrderView):
+    """The order history of the current user, orders are placed like through OrderView"""
+    pagination_class = OrderPagination
+
+    def get_orders(self, request):
+        # Items of all orders in one query; sub_total reads the stored unit_price, the product is not needed
+        return Order.objects.filter(user=request.user).prefetch_related('order_item')
 
     def get(self, request, order_number=None):
         if order_number:
             # Get specific order
             try:
-                order = Order.objects.get(number=order_number, user=request.user)
+                order = self.get_orders(request).get(number=order_number)
                 serializer = OrderSerializer(order)
                 return Response(serializer.data)
             except Order.DoesNotExist:
                 return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            # Get all orders for the current user
-            orders = Order.objects.filter(user=request.user).order_by('-created_at')
+            # Get the current user's orders one page at a time
+            paginator = self.pagination_class()
+            orders = paginator.paginate_queryset(self.get_orders(request), request, view=self)
             serializer = OrderSerializer(orders, many=True)
-            return Response(serializer.data)
-
-    def post(self, request):
-        # Validate that card number is provided
-        card_number = request.data.get('card_number')
-        if card_number is None:
-            return Response({'message': 'Please input Credit Card No'})
-
-        # Prepare order data (excluding items and card_number)
-        order_data = {
-            'user': request.user,
-            'payment': request.data.get('payment', 'Cash on Delivery'),  # Default payment method
-        }
-
-        # Create the order
-        order = Order.objects.create(**order_data)
-
-        # Handle items separately after order is created
-        items_data = request.data.get('items', [])
-        order_items = []
-        for item_data in items_data:
-            from .models import Products
-            # Get the product based on product_id from the request
-            product_id = item_data.get('product_id')
-            quantity_requested = item_data.get('quantity', 1)
-            if product_id:
-                try:
-                    product = Products.objects.get(id=product_id)
-                    # Check stock availability
-                    if product.stock < quantity_requested:
-                        # Rollback: delete the order since insufficient stock
-                        order.delete()
-                        return Response(
-                            {'error': f'Insufficient stock for {product.name}. Available: {product.stock}, Requested: {quantity_requested}'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-
-                    # Create order item
-                    order_item = OrderItem.objects.create(
-                        product=product,
-                        quantity=quantity_requested
-                    )
-                    order_items.append(order_item)
-
-                    # Decrease product stock
-                    product.stock -= quantity_requested
-                    if product.stock <= 0:
-                        product.status = product.StatusofProduct.OUT_OF_STOCK
-                    product.save()
-                except Products.DoesNotExist:
-                    # Rollback: delete the order since we can't create the items
-                    order.delete()
-                    return Response(
-                        {'error': f'Product with id {product_id} does not exist'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-        # Add order items to the order
-        order.order_item.set(order_items)
-
-        # Update order items for discount days
-        try:
-            for item in order.order_item.all():
-                # Check if item has a valid product
-                if item.product and item.product.user:
-                    current_date = timezone.now().date()
-                    try:
-                        from discounts.models import DiscountDay
-                        discount_day = DiscountDay.objects.get(
-                            seller=item.product.user,
-                            date=current_date,
-                            is_active=True
-                        )
-                        item.is_discount_day = True
-                        item.save()
-                    except DiscountDay.DoesNotExist:
-                        item.is_discount_day = False
-                        item.save()
-        except Exception as e:
-            # Log the error but don't fail the order
-            print(f"Error updating discount days: {e}")
-            pass  # Continue with the order even if discount update fails
-
-        # Serialize the created order for response
-        response_serializer = OrderSerializer(order)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            return paginator.get_paginated_response(serializer.data)
 
     def delete(self, request, order_number):
         try:
             order = Order.objects.get(number=order_number, user=request.user)
-            order.delete()
+            delete_order(order)
             return Response({'message': 'Order deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -348,34 +298,32 @@ class InventoryUpdateView(APIView):
 
     def patch(self, request, pk):
         try:
-            product = Products.objects.get(id=pk, user=request.user)
+            products = Products.objects.filter(id=pk, user=request.user)
 
             # Get the restock amount
             restock_amount = request.data.get('restock', 0)
             if restock_amount and int(restock_amount) > 0:
-                product.stock += int(restock_amount)
-                if product.stock > 0:
-                    product.status = product.StatusofProduct.AVAILABLE
-                product.save()
+                if not products.restock(int(restock_amount)):
+                    raise Products.DoesNotExist
+                current_stock = products.values_list('stock', flat=True).get()
 
                 return Response({
-                    'message': f'Product restocked successfully. New stock: {product.stock}',
-                    'current_stock': product.stock
+                    'message': f'Product restocked successfully. New stock: {current_stock}',
+                    'current_stock': current_stock
                 })
 
             # Or update stock directly
             new_stock = request.data.get('stock', None)
             if new_stock is not None:
-                product.stock = int(new_stock)
-                if product.stock > 0:
-                    product.status = product.StatusofProduct.AVAILABLE
-                else:
-                    product.status = product.StatusofProduct.OUT_OF_STOCK
-                product.save()
+                new_stock = int(new_stock)
+                if new_stock < 0:
+                    raise ValueError
+                if not products.set_stock(new_stock):
+                    raise Products.DoesNotExist
 
                 return Response({
                     'message': 'Product stock updated successfully',
-                    'current_stock': product.stock
+                    'current_stock': new_stock
                 })
 
             return Response(
@@ -385,4 +333,40 @@ class InventoryUpdateView(APIView):
         except Products.DoesNotExist:
             return Response({'error': 'Product not found or unauthorized'}, status=status.HTTP_404_NOT_FOUND)
         except ValueError:
-            return Response({'error': 'Stock value must be a valid number'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': 'Stock value must be a valid number'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Native async versions of the read endpoints for ASGI deployments, see core.asyncapi.
+# Same bodies as the DRF views, read straight from the database without the response cache.
+
+@async_api_view(replica=True)
+async def async_product_list(request):
+    """GET /api/async/product/, the filters, ?ordering= and ?facets=1 of ProductView"""
+    params = ProductListQuerySerializer(data=request.GET)
+    params.is_valid(raise_exception=True)
+    paginator = ProductCursorPagination()
+    paginator.ordering = CATALOG_ORDERINGS[params.validated_data['ordering']]
+    page = await paginator.apaginate_queryset(Products.catalog.filter(**params.filters()), request)
+    data = paginator.get_paginated_data(ProductSerializer(page, many=True).data)
+    if params.validated_data['facets']:
+        data['facets'] = await ProductFacetCount.acounts()
+    return json_response(data)
+
+
+@async_api_view()
+async def async_product_detail(request, pk):
+    try:
+        product = await Products.catalog.aget(id=pk)
+    except Products.DoesNotExist:
+        return json_response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(ProductSerializer(product).data)
+
+
+@async_api_view()
+async def async_order_history(request):
+    """GET /api/async/orders/, the order history of CustomerOrderView with the total in X-Total-Count"""
+    orders = Order.objects.filter(user_id=request.user.pk)
+    paginator = OrderPagination()
+    page = await paginator.apaginate_queryset(orders.prefetch_related('order_item'), request)
+    data = paginator.get_paginated_data(OrderSerializer(page, many=True).data)
+    return json_response(data, headers={'X-Total-Count': str(await orders.acount())})